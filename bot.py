@@ -11,7 +11,7 @@ from discord import user
 from discord.ext import commands
 
 from config import token, DEFAULT_PREFIX # Contains token = 'xxx'   
-from cogs.helper import smart_send, error_embed
+from cogs.helper import smart_send, error_embed, EmbedUpdater, HttpClient, ReactionRegistry
 
 logging.basicConfig(level=logging.INFO,
                     format='[%(asctime)s] [%(levelname)s] %(message)s',
@@ -98,6 +98,9 @@ class XenonBot(commands.Bot):
         self.con.execute("PRAGMA foreign_keys = 1")
         self.guild_prefix = defaultdict(lambda: DEFAULT_PREFIX)
         self.blacklist = set()
+        self.embed_updater = EmbedUpdater(self.loop) # Shared by cogs to debounce embed edits
+        self.http_client = HttpClient(self.loop, join('data', 'http_cache')) # Shared by cogs for web requests
+        self.reaction_registry = ReactionRegistry() # Messages which cogs track reactions on
 
         # Ensure database exists
         self.con.execute("""CREATE TABLE IF NOT EXISTS settings (
@@ -226,6 +229,10 @@ class XenonBot(commands.Bot):
                 message += '\n'
         await smart_send(ctx, message)
 
+    async def close(self):
+        await self.http_client.close()
+        await super().close()
+
     # Listeners
     async def on_ready(self):
         self.uptime = self.uptime or datetime.today()
@@ -249,6 +256,14 @@ class XenonBot(commands.Bot):
             return
         await self.process_commands(message)
 
+    async def on_raw_reaction_add(self, payload):
+        if payload.user_id != self.user.id:
+            await self.reaction_registry.dispatch(payload, True)
+
+    async def on_raw_reaction_remove(self, payload):
+        if payload.user_id != self.user.id:
+            await self.reaction_registry.dispatch(payload, False)
+
 
 logging.info("Starting up the bot.")
 bot = XenonBot(
@@ -30,6 +30,13 @@ class Admin(commands.Cog, name='admin'):
 
         return await ctx.send(embed=discord.Embed(title="Uptime", description=text, colour=discord.Colour.blue()))
             
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def editstats(self, ctx):
+        """Owner only command to view how many embed edits have been debounced."""
+        updater = self.bot.embed_updater
+        return await ctx.send(f"Embed edits made: {updater.edits}\nEdit requests merged: {updater.saved}\nPending edits: {len(updater.pending)}")
+
     ### Blacklisting Commands ###
 
     @commands.command(hidden=True)
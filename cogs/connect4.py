@@ -0,0 +1,204 @@
+"""
+Connect Four engine used by the games cog.
+
+The board is stored as two bitboards, following the layout described by
+Pascal Pons. Each column takes up HEIGHT + 1 bits, with the extra bit on
+top of each column always empty so that alignments cannot wrap around
+columns. `position` holds the stones of the player to move, and `mask`
+holds every stone on the board.
+
+The search functions are module-level so that they can be run in a worker
+process with `loop.run_in_executor`.
+"""
+import time
+import typing
+
+WIDTH = 7
+HEIGHT = 6
+CELLS = WIDTH * HEIGHT
+_H1 = HEIGHT + 1
+
+BOTTOM = sum(1 << (col * _H1) for col in range(WIDTH))
+BOARD = BOTTOM * ((1 << HEIGHT) - 1)
+
+# Columns in the order they are searched, center first
+ORDER = (3, 2, 4, 1, 5, 0, 6)
+
+# Score of winning on the current move. Winning sooner scores higher.
+WIN = 1000
+
+def bottom_mask(col: int) -> int:
+    return 1 << (col * _H1)
+
+def top_mask(col: int) -> int:
+    return 1 << (HEIGHT - 1 + col * _H1)
+
+def column_mask(col: int) -> int:
+    return ((1 << HEIGHT) - 1) << (col * _H1)
+
+def can_play(mask: int, col: int) -> bool:
+    return not mask & top_mask(col)
+
+def alignment(position: int) -> bool:
+    """Return whether there are four stones in a row in `position`, in constant time."""
+    for shift in (_H1, _H1 - 1, _H1 + 1, 1): # Horizontal, both diagonals, vertical
+        m = position & (position >> shift)
+        if m & (m >> 2 * shift):
+            return True
+    return False
+
+def is_winning_move(position: int, mask: int, col: int) -> bool:
+    return alignment(position | ((mask + bottom_mask(col)) & column_mask(col)))
+
+def winning_cells(position: int, mask: int) -> int:
+    """Return the empty cells which would complete four in a row for `position`."""
+    r = (position << 1) & (position << 2) & (position << 3)
+    for shift in (_H1, _H1 - 1, _H1 + 1):
+        p = (position << shift) & (position << 2 * shift)
+        r |= p & (position << 3 * shift)
+        r |= p & (position >> shift)
+        p = (position >> shift) & (position >> 2 * shift)
+        r |= p & (position << shift)
+        r |= p & (position >> 3 * shift)
+    return r & (BOARD ^ mask)
+
+def heuristic(position: int, mask: int) -> int:
+    """Estimate the position for the player to move, by comparing the number of winning cells."""
+    return bin(winning_cells(position, mask)).count('1') - bin(winning_cells(position ^ mask, mask)).count('1')
+
+
+class Board:
+    """A game of Connect Four. Player 0 moves first."""
+    __slots__ = ('position', 'mask', 'moves')
+
+    def __init__(self):
+        self.position = 0
+        self.mask = 0
+        self.moves = 0
+
+    def can_play(self, col: int) -> bool:
+        return 0 <= col < WIDTH and can_play(self.mask, col)
+
+    def play(self, col: int) -> bool:
+        """Drop a stone of the player to move in the column. Returns whether the move won the game."""
+        won = is_winning_move(self.position, self.mask, col)
+        self.position ^= self.mask
+        self.mask |= self.mask + bottom_mask(col)
+        self.moves += 1
+        return won
+
+    def is_full(self) -> bool:
+        return self.moves == CELLS
+
+    def stones(self, player: int) -> int:
+        """Return the bitboard of the player's stones."""
+        return self.position if self.moves % 2 == player else self.position ^ self.mask
+
+    def render(self, tokens: typing.Sequence[str], blank: str) -> str:
+        """Return the board as text, top row first, using `tokens` for each player's stones."""
+        first = self.stones(0)
+        rows = list()
+        for row in reversed(range(HEIGHT)):
+            line = str()
+            for col in range(WIDTH):
+                bit = 1 << (col * _H1 + row)
+                line += blank if not self.mask & bit else tokens[0 if first & bit else 1]
+            rows.append(line)
+        return '\n'.join(rows)
+
+
+################################################################################
+#                                    Search                                    #
+################################################################################
+
+class _Timeout(Exception):
+    pass
+
+# Transposition table of key => (depth, flag, value). It lives in the worker
+# process, so it is kept between moves and between games.
+_table = dict()
+_TABLE_LIMIT = 1_000_000
+_EXACT, _LOWER, _UPPER = 0, 1, 2
+
+class _Search:
+    __slots__ = ('deadline', 'nodes')
+
+    def __init__(self, deadline: float):
+        self.deadline = deadline
+        self.nodes = 0
+
+    def negamax(self, position: int, mask: int, moves: int, depth: int, alpha: int, beta: int) -> int:
+        self.nodes += 1
+        if not self.nodes & 1023 and time.monotonic() > self.deadline:
+            raise _Timeout
+        if moves == CELLS:
+            return 0
+        for col in ORDER:
+            if can_play(mask, col) and is_winning_move(position, mask, col):
+                return WIN - moves
+        if depth == 0:
+            return heuristic(position, mask)
+
+        key = position + mask
+        entry = _table.get(key)
+        if entry is not None and entry[0] >= depth:
+            _, flag, value = entry
+            if flag == _EXACT:
+                return value
+            if flag == _LOWER:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if alpha >= beta:
+                return value
+
+        original_alpha = alpha
+        best = -WIN * 2
+        for col in ORDER:
+            if not can_play(mask, col):
+                continue
+            score = -self.negamax(position ^ mask, mask | (mask + bottom_mask(col)), moves + 1, depth - 1, -beta, -alpha)
+            if score > best:
+                best = score
+            if best > alpha:
+                alpha = best
+            if alpha >= beta:
+                break
+
+        flag = _UPPER if best <= original_alpha else (_LOWER if best >= beta else _EXACT)
+        _table[key] = (depth, flag, best)
+        return best
+
+    def root(self, position: int, mask: int, moves: int, depth: int) -> typing.Tuple[int, int]:
+        """Return the best column and its score, searching `depth` moves ahead."""
+        alpha, beta = -WIN * 2, WIN * 2
+        best_col, best = None, -WIN * 2
+        for col in ORDER:
+            if not can_play(mask, col):
+                continue
+            if is_winning_move(position, mask, col):
+                return col, WIN - moves
+            score = -self.negamax(position ^ mask, mask | (mask + bottom_mask(col)), moves + 1, depth - 1, -beta, -alpha)
+            if score > best:
+                best_col, best = col, score
+                alpha = max(alpha, score)
+        return best_col, best
+
+def best_move(position: int, mask: int, moves: int, budget: float) -> int:
+    """
+    Return the column the player to move should play, using iterative
+    deepening alpha-beta search for up to `budget` seconds.
+    """
+    if len(_table) > _TABLE_LIMIT:
+        _table.clear()
+    search = _Search(time.monotonic() + budget)
+    best = next(col for col in ORDER if can_play(mask, col))
+    for depth in range(1, CELLS - moves + 1):
+        try:
+            col, score = search.root(position, mask, moves, depth)
+        except _Timeout:
+            break
+        best = col
+        if abs(score) > WIN - CELLS:
+            break # The result of the game is already decided
+    return best
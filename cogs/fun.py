@@ -1,13 +1,36 @@
 import logging
 import sqlite3
-from collections import Counter
+import asyncio
+import typing
+from collections import Counter, defaultdict
 
 import discord
 from discord.ext import commands
 
+# Maximum number of different reactions on a message
+MAX_REACTIONS = 20
+# Number of seconds between each reaction added by $react, to stay clear of rate limits
+REACTION_INTERVAL = 0.3
+
 def lowercase_string(argument):
     return argument.lower()
 
+def compile_emoji(string: str) -> typing.Tuple[typing.Tuple[str, ...], bool]:
+    """
+    Converts the string to the sequence of unicode emojis to react with.
+    Returns the emojis, and whether every character could be converted
+    within the reaction limit.
+    """
+    string = string.replace('ok', '🆗', 1)
+    repeats = Counter()
+    plan = list()
+    for ch in string:
+        options = emoji.get(ch, ())
+        if repeats[ch] < len(options):
+            plan.append(options[repeats[ch]])
+            repeats[ch] += 1
+    return tuple(plan[:MAX_REACTIONS]), len(plan) == len(string) <= MAX_REACTIONS
+
 class Fun(commands.Cog, name='fun'):
 
     def __init__(self, bot):
@@ -19,6 +42,11 @@ class Fun(commands.Cog, name='fun'):
                                 word TEXT NOT NULL,
                                 UNIQUE(guild_id, word))""")
 
+        # Allowed words of each guild, compiled into their emojis
+        self.allowed = defaultdict(dict) # Guild ID => {word: emojis}
+        for guild_id, word in self.con.execute("SELECT guild_id, word FROM allowedreacts"):
+            self.allowed[guild_id][word] = compile_emoji(word)[0]
+
     def cog_unload(self):
         pass
 
@@ -31,6 +59,9 @@ class Fun(commands.Cog, name='fun'):
         """
         if len(text) > 20:
             return await ctx.send("Reaction cannot exceed 20 characters.")
+        plan, valid = compile_emoji(text)
+        if not valid:
+            return await ctx.send("Reaction can only use letters, numbers, spaces, '!' and '?', and cannot repeat a character more times than there are emojis for it.")
         try:
             with self.con:
                 self.con.execute("INSERT INTO allowedreacts VALUES(?, ?)", (ctx.guild.id, text))
@@ -38,6 +69,7 @@ class Fun(commands.Cog, name='fun'):
             # Technically sending in PMs can also trigger this
             return await ctx.send("That word is already in the allowed reactions list.")
         else:
+            self.allowed[ctx.guild.id][text] = plan
             return await ctx.send(f"{text} added to the allowed reactions list.")
 
     @commands.command()
@@ -52,6 +84,7 @@ class Fun(commands.Cog, name='fun'):
         if n == 0:
             return await ctx.send(f"{text} is not in the allowed reactions list.")
         elif n == 1:
+            self.allowed[ctx.guild.id].pop(text, None)
             return await ctx.send(f"{text} removed from the allowed reactions list.")
         else:
             logging.error("Deleted more than one reaction for removereact")
@@ -62,45 +95,51 @@ class Fun(commands.Cog, name='fun'):
         """Prints out a list of allowed reacts for use in the $react command."""
 
         text = "Allowed Reacts: "
-        for row in self.con.execute("SELECT word FROM allowedreacts WHERE guild_id = ?", (ctx.guild.id, )):
-            text += f"`{row[0]}`, "
+        for word in self.allowed.get(ctx.guild.id, ()):
+            text += f"`{word}`, "
         if text == "Allowed Reacts: ":
             text = "This server has no allowed reacts."
         else:
             text = text[:-2] + '.'
         return await ctx.send(text)
 
-    async def textemoji(self, message: discord.Message, string: str):
-        """Converts the string to unicode emojis."""
-        string = string.replace('ok', '🆗', 1)        
-        repeats = Counter()
-        for ch in string:
+    async def textemoji(self, ctx, message: discord.PartialMessage, plan: typing.Sequence[str]):
+        """
+        Reacts to the message with the emojis, one at a time. The command
+        message is only deleted once the first reaction has been added, so
+        that the user sees the error if the message cannot be reacted to.
+        """
+        for i, reaction in enumerate(plan):
+            if i:
+                await asyncio.sleep(REACTION_INTERVAL)
             try:
-                await message.add_reaction(emoji[ch][repeats[ch]])
-                repeats[ch] += 1
-            except IndexError:
-                continue
+                await message.add_reaction(reaction)
+            except discord.NotFound:
+                return await ctx.send("That message could not be found.")
+            except discord.HTTPException:
+                return await ctx.send("Unable to react to that message.")
+            if not i:
+                await ctx.message.delete()
     
     @commands.command()
-    async def react(self, ctx, text: lowercase_string, message: discord.Message):
+    async def react(self, ctx, text: lowercase_string, message: discord.PartialMessage):
         """Sets the reacts of a message, if allowed in the allowed reactions list.
         'text' is the reaction text and 'message' is the message_id or the link of the message to be reacted.
         Example Usage: $react okboomer https://discordapp.com/channels/655024044/7078986/716643449"""
 
-        if self.con.execute("SELECT * FROM allowedreacts WHERE guild_id = ? AND word = ?", (ctx.guild.id, text)).fetchone():
-            await ctx.message.delete()
-            return await self.textemoji(message, text)
+        plan = self.allowed.get(ctx.guild.id, {}).get(text)
+        if plan is not None:
+            return await self.textemoji(ctx, message, plan)
         else:
             return await ctx.send(f"`{text}` is not an allowed reaction.")
 
     @commands.command()
     @commands.has_permissions(manage_guild=True)
-    async def adminreact(self, ctx, text: lowercase_string, message: discord.Message):
+    async def adminreact(self, ctx, text: lowercase_string, message: discord.PartialMessage):
         """Sets the reacts of a message. Skips checking allowed reactions.
         'text' is the reaction text and 'message' is the message_id of the message to be reacted.
         Example Usage: $react omg 123456789"""
-        await ctx.message.delete()
-        return await self.textemoji(message, text)
+        return await self.textemoji(ctx, message, compile_emoji(text)[0])
 
 emoji = {
     'a': ['🇦', '🅰️'], 
@@ -2,11 +2,20 @@ import discord
 from discord.ext import commands
 import logging
 import pickle as pkl
-from os.path import join, isfile, isdir
-from os import listdir
+from os.path import join, isfile, isdir, getsize
+from os import listdir, replace, stat
 from collections import defaultdict
+from array import array
 import asyncio
 import random
+import typing
+import mmap
+import time
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import io
+
+from cogs import connect4, trivia
 
 class PositiveInt(commands.Converter):
     async def convert(self, ctx, argument):
@@ -21,71 +30,370 @@ class PositiveInt(commands.Converter):
 class GamesError(commands.errors.CommandError):
     pass
 
-def specialisedDict():
-    return dict(channel=0, score=defaultdict(int))
+# Hangman difficulties, by the number of distinct letters in the word
+HANGMAN_DIFFICULTIES = {
+    'easy': range(0, 6),
+    'medium': range(6, 9),
+    'hard': range(9, 27)
+}
+# Word lists larger than this many bytes are memory-mapped instead of read into memory
+MMAP_THRESHOLD = 1 << 20
+# Number of seconds the bot spends searching for its move in Connect Four
+CONNECT4_AI_BUDGET = 2.0
+# Number of seconds players have to answer each trivia question
+TRIVIA_ANSWER_TIME = 20
+# Number of seconds to keep collecting answers after the first one arrives, as
+# messages can be delivered out of order by up to this much
+ANSWER_JITTER_WINDOW = 0.5
+# Games which have reaction times recorded
+TIMED_GAMES = ('fishing', 'fishwords')
+
+def reaction_ms(prompt: discord.Message, answer: discord.Message) -> int:
+    """Return the milliseconds between two messages, from the timestamps in their snowflakes."""
+    return (answer.id >> 22) - (prompt.id >> 22)
+
+class WordList:
+    """
+    Words of a hangman category. The words are kept as the raw file contents,
+    along with arrays of the offsets of each word and arrays of word indices
+    for each difficulty, so that choosing a word of any difficulty is O(1).
+    """
+    __slots__ = ('path', 'mtime', 'data', 'starts', 'ends', 'by_difficulty', '_file')
+
+    def __init__(self, path: str):
+        self.path = path
+        self.data = self._file = None
+        self.load()
+
+    def load(self):
+        """(Re)load the word list from its file."""
+        self.close()
+        self.mtime = stat(self.path).st_mtime_ns
+        if getsize(self.path) > MMAP_THRESHOLD:
+            self._file = open(self.path, 'rb')
+            self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            with open(self.path, 'rb') as f:
+                self.data = f.read()
+
+        self.starts = array('L')
+        self.ends = array('L')
+        self.by_difficulty = {difficulty: array('L') for difficulty in HANGMAN_DIFFICULTIES}
+        start, size = 0, len(self.data)
+        while start < size:
+            end = self.data.find(b'\n', start)
+            if end == -1:
+                end = size
+            word = self.data[start:end].decode().strip().lower()
+            if word:
+                distinct = len({letter for letter in word if letter.isalpha()})
+                for difficulty, letters in HANGMAN_DIFFICULTIES.items():
+                    if distinct in letters:
+                        self.by_difficulty[difficulty].append(len(self.starts))
+                self.starts.append(start)
+                self.ends.append(end)
+            start = end + 1
+
+    def reload_if_changed(self):
+        if stat(self.path).st_mtime_ns != self.mtime:
+            self.load()
+
+    def close(self):
+        if self._file is not None:
+            self.data.close()
+            self._file.close()
+            self._file = None
+
+    def __len__(self):
+        return len(self.starts)
+
+    def count(self, difficulty: str=None) -> int:
+        return len(self) if difficulty is None else len(self.by_difficulty[difficulty])
+
+    def choose(self, difficulty: str=None) -> str:
+        """Return a random word, of the given difficulty if provided."""
+        index = random.randrange(len(self)) if difficulty is None else random.choice(self.by_difficulty[difficulty])
+        return self.data[self.starts[index]:self.ends[index]].decode().strip().lower()
+
+class WordBank:
+    """
+    Hangman word lists in a folder, one category per text file. Each file is
+    loaded once, and only loaded again when it is modified.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.mtime = None
+        self.lists = dict() # Category => WordList
+
+    def refresh(self):
+        """Pick up added or removed categories."""
+        if not isdir(self.path):
+            raise GamesError("No hangman folder detected in data folder.")
+        mtime = stat(self.path).st_mtime_ns
+        if mtime == self.mtime:
+            return
+        # Categories are matched case-insensitively, so they are keyed in lowercase
+        files = {f[:-4].lower(): f for f in listdir(self.path) if f.endswith('.txt')}
+        for category in self.lists.keys() - files.keys():
+            self.lists.pop(category).close()
+        for category in files.keys() - self.lists.keys():
+            self.lists[category] = WordList(join(self.path, files[category]))
+        self.mtime = mtime
+
+    def categories(self) -> typing.List[str]:
+        self.refresh()
+        return sorted(self.lists)
+
+    def get(self, category: str) -> WordList:
+        self.refresh()
+        if category not in self.lists:
+            raise GamesError("That category does not exist.")
+        words = self.lists[category]
+        words.reload_if_changed()
+        return words
+
+class GameSession:
+    """
+    State of a game being played in a channel. Messages sent in the channel
+    are fed to the session by the games cog, so that waiting for a message
+    does not add a check to every message the bot receives.
+    """
+    __slots__ = ('channel_id', 'origin', 'message', 'players', 'signals', 'started', '_check', '_waiter', '_collected')
+
+    def __init__(self, ctx: commands.Context):
+        self.channel_id = ctx.channel.id
+        self.origin = ctx.message.id # ID of the message of the command which started the game
+        self.message = None # discord.Message => The game's signup message
+        self.players = set() # set => Set of players who signed up for the game
+        self.signals = asyncio.Queue() # (emoji, user) => Requests to start or cancel the game during signups
+        self.started = None # float => Time when signups closed and the game started
+        self._check = None
+        self._waiter = None
+        self._collected = None
+
+    async def wait_for_message(self, check: typing.Callable, timeout: float=None) -> discord.Message:
+        """Similar to `bot.wait_for('message')`, but only for messages in this session's channel."""
+        self._check = check
+        self._waiter = asyncio.get_event_loop().create_future()
+        try:
+            return await asyncio.wait_for(self._waiter, timeout)
+        finally:
+            self._check = self._waiter = None
 
-def gamesDict():
-    return [None,   # discord.Message => The game's signup message
-            False,  # bool => Whether the game is accepting signups
-            set()]  # set => Set of players who signed up for the game
+    async def collect_messages(self, check: typing.Callable, timeout: float=None,
+                               window: float=ANSWER_JITTER_WINDOW) -> typing.List[discord.Message]:
+        """
+        Wait for the first message which passes `check`, then keep collecting
+        passing messages for `window` seconds. The messages are returned in the
+        order they were sent, which is not always the order they arrived in.
+        """
+        first = await self.wait_for_message(check, timeout)
+        self._check, self._collected = check, [first]
+        try:
+            await asyncio.sleep(window)
+            return sorted(self._collected, key=lambda message: message.id)
+        finally:
+            self._check = self._collected = None
+
+    def feed(self, message: discord.Message):
+        """Pass a message sent in the session's channel to the pending wait, if any."""
+        if self._check is None or not self._check(message):
+            return
+        if self._collected is not None:
+            self._collected.append(message)
+        elif not self._waiter.done():
+            self._waiter.set_result(message)
 
 class Games(commands.Cog, name='games'):
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.embed_pooling = defaultdict(bool) # Used to group edits to embeds together. See embed_editor_helper
-        self.games_info = defaultdict(gamesDict) # Key is guild Id
+        self.sessions = dict() # Channel ID => GameSession of the game in that channel
+        self.signup_messages = dict() # Message ID => GameSession which is accepting signups on that message
         self.prefix = self.bot.get_guild_prefix # Used in help commands
-        logging.info("Attempting to load designated games channel.")
-        try:
-            with open(join('data', 'games_data.pkl'), 'rb') as f:
-                self.data = defaultdict(specialisedDict, pkl.load(f))
-            logging.info("Loaded designated games channels.")
-        except OSError as e:
-            # Unable to find the file
-            logging.warning(f"{type(e)}: {e}")
-            self.data = defaultdict(specialisedDict)
+        self.con = self.bot.con
+
+        # Ensure tables exist
+        self.con.execute("""CREATE TABLE IF NOT EXISTS gamechannels (
+                                channel_id  INTEGER PRIMARY KEY NOT NULL,
+                                guild_id    INTEGER NOT NULL)""")
+        self.con.execute("CREATE INDEX IF NOT EXISTS gamechannels_guild_idx ON gamechannels(guild_id)")
+        self.con.execute("""CREATE TABLE IF NOT EXISTS gamescores (
+                                guild_id    INTEGER NOT NULL,
+                                user_id     INTEGER NOT NULL,
+                                score       INTEGER NOT NULL,
+                                PRIMARY KEY(guild_id, user_id))""")
+        # Leaderboard order is by score, with ties broken by user ID, both descending
+        self.con.execute("CREATE INDEX IF NOT EXISTS gamescores_rank_idx ON gamescores(guild_id, score, user_id)")
+        self.con.execute("""CREATE TABLE IF NOT EXISTS fastestfingers (
+                                guild_id    INTEGER NOT NULL,
+                                game        TEXT NOT NULL,
+                                user_id     INTEGER NOT NULL,
+                                best_ms     INTEGER NOT NULL,
+                                PRIMARY KEY(guild_id, game, user_id))""")
+        self.con.execute("CREATE INDEX IF NOT EXISTS fastestfingers_best_idx ON fastestfingers(guild_id, game, best_ms)")
+        # `results` holds the players and their scores as packed pairs of 64-bit integers
+        self.con.execute("""CREATE TABLE IF NOT EXISTS gamehistory (
+                                id          INTEGER PRIMARY KEY,
+                                guild_id    INTEGER NOT NULL,
+                                game        TEXT NOT NULL,
+                                ended       INTEGER NOT NULL,
+                                duration    INTEGER NOT NULL,
+                                results     BLOB NOT NULL)""")
+        self.con.execute("""CREATE TABLE IF NOT EXISTS playerstats (
+                                guild_id    INTEGER NOT NULL,
+                                user_id     INTEGER NOT NULL,
+                                game        TEXT NOT NULL,
+                                played      INTEGER NOT NULL,
+                                wins        INTEGER NOT NULL,
+                                total_score INTEGER NOT NULL,
+                                PRIMARY KEY(guild_id, user_id, game))""")
+        self.con.commit()
+        self.import_pickle()
+
+        # Load designated games channels into memory, as they are checked for every game
+        self.game_channels = {row[0] for row in self.con.execute("SELECT channel_id FROM gamechannels")}
+
         self.word_placing = ('1st', '2nd', '3rd', 
                              '4th', '5th', '6th', 
                              '7th', '8th', '9th')
         self.alphabet = 'abcdefghijklmnopqrstuvwxyz'
-        
+        self.word_bank = WordBank(join('.', 'data', 'hangman'))
+        self.executor = None # Worker process for game AI, created when first needed
+        self.question_bank = trivia.QuestionBank(join('data', 'trivia.db'))
+
     def cog_unload(self):
-        logging.info("Saving games information before unloading of cog.")
-        with open(join('data', 'games_data.pkl'), 'wb') as f:
-            pkl.dump(dict(self.data), f)
-        logging.info("Saved games information.")
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+        self.question_bank.close()
+        
+    def import_pickle(self):
+        """
+        One-time import of the games channels and scores from the pickle file
+        used by older versions. The file is renamed once imported.
+        """
+        path = join('data', 'games_data.pkl')
+        if not isfile(path):
+            return
+        logging.info("Importing games data from pickle file.")
+        with open(path, 'rb') as f:
+            data = pkl.load(f)
+        with self.con:
+            for guild_id, info in data.items():
+                if info['channel']:
+                    self.con.execute("INSERT OR REPLACE INTO gamechannels(channel_id, guild_id) VALUES (?, ?)",
+                                     (info['channel'], guild_id))
+                self.upsert_scores(guild_id, info['score'])
+            # Renamed before the commit, so that a failed import is rolled back and
+            # scores which are added on to are never imported twice
+            replace(path, path + '.imported')
+        logging.info("Imported games data from pickle file.")
 
     @commands.command(hidden=True)
     @commands.is_owner()
     async def check_games(self, ctx):
         """Owner-only command for debugging purposes."""
-        print(self.data)
-        print(self.games_info)
+        print(self.game_channels)
+        print(self.sessions)
 
     @commands.Cog.listener()
     async def on_command_error(self, ctx, error):
         if isinstance(error, GamesError):
             await ctx.send(str(error))
 
+    async def cog_after_invoke(self, ctx):
+        # Clear the game started by the command, even if the game raised an error
+        session = self.sessions.get(ctx.channel.id)
+        if session is not None and session.origin == ctx.message.id:
+            del self.sessions[ctx.channel.id]
+            if session.message is not None:
+                self.signup_messages.pop(session.message.id, None)
+
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        # Route messages to the game in their channel, if there is one
+        if message.author.bot:
+            return
+        session = self.sessions.get(message.channel.id)
+        if session is not None:
+            session.feed(message)
+
     ############################################################################
-    #Functions relating to self.data, ie Games channel settings and scoreboards#
+    #     Functions relating to the games channel settings and scoreboards     #
     ############################################################################
 
+    def add_scores(self, guild_id: int, changes: dict):
+        """
+        Add each score change in `changes`, a dictionary of user IDs to the
+        change in score, to the guild's scoreboard in a single transaction.
+        """
+        with self.con:
+            self.upsert_scores(guild_id, changes)
+
+    def upsert_scores(self, guild_id: int, changes: dict):
+        """Add the score changes to the guild's scoreboard. Should be called inside a transaction."""
+        self.con.executemany("""INSERT INTO gamescores(guild_id, user_id, score) VALUES (?, ?, ?)
+                                ON CONFLICT(guild_id, user_id) DO UPDATE SET score = score + excluded.score""",
+                             ((guild_id, user_id, change) for user_id, change in changes.items()))
+
+    def get_score(self, guild_id: int, user_id: int) -> typing.Optional[int]:
+        """Return the score of the user in the guild, or `None` if the user has no score."""
+        row = self.con.execute("SELECT score FROM gamescores WHERE guild_id = ? AND user_id = ?",
+                               (guild_id, user_id)).fetchone()
+        return row and row[0]
+
+    def get_rank(self, guild_id: int, score: int) -> int:
+        """Return the rank in the guild of a score. Tied scores share the same rank."""
+        return self.con.execute("SELECT COUNT(*) FROM gamescores WHERE guild_id = ? AND score > ?",
+                                (guild_id, score)).fetchone()[0] + 1
+
+    def top_scores(self, guild_id: int, num: int) -> typing.List[typing.Tuple[int, int]]:
+        """Return the top `num` (user ID, score) pairs in the guild."""
+        return self.con.execute("""SELECT user_id, score FROM gamescores WHERE guild_id = ?
+                                   ORDER BY score DESC, user_id DESC LIMIT ?""", (guild_id, num)).fetchall()
+
+    def nearby_scores(self, guild_id: int, user_id: int, num: int) -> typing.Optional[typing.List[typing.Tuple[int, int, int]]]:
+        """
+        Return up to `num` (rank, user ID, score) rows on each side of the user
+        in the guild's leaderboard, including the user. Ranks are the same as
+        `get_rank`, so tied scores share the same rank. Returns `None` if the
+        user has no score in the guild.
+        """
+        score = self.get_score(guild_id, user_id)
+        if score is None:
+            return None
+        above = self.con.execute("""SELECT user_id, score FROM gamescores
+                                    WHERE guild_id = ? AND (score, user_id) > (?, ?)
+                                    ORDER BY score, user_id LIMIT ?""", (guild_id, score, user_id, num)).fetchall()
+        below = self.con.execute("""SELECT user_id, score FROM gamescores
+                                    WHERE guild_id = ? AND (score, user_id) < (?, ?)
+                                    ORDER BY score DESC, user_id DESC LIMIT ?""", (guild_id, score, user_id, num)).fetchall()
+        window = above[::-1] + [(user_id, score)] + below
+        ranks = {s: self.get_rank(guild_id, s) for s in {s for _, s in window}}
+        return [(ranks[s], u, s) for u, s in window]
+
     @commands.command()
     @commands.has_guild_permissions(manage_guild=True)
     async def game_channel(self, ctx, *, channel: discord.TextChannel=None):
         """
-        Return the set game channel is a text channel is not provided.
-        Else, set the provided text channel as the new games channel.
+        Return the games channels if a text channel is not provided. Else, set
+        the provided text channel as a games channel, or unset it if it is
+        already one. One game can be played at a time in each games channel.
         """
         if channel is None:
-            channel_id = self.data[ctx.guild.id]['channel']
-            if channel_id is None:
+            channels = [c.mention for c in ctx.guild.text_channels if c.id in self.game_channels]
+            if not channels:
                 return await ctx.send("There is no games channel for this server.")
-            return await ctx.send(f"The current games channel is {self.bot.get_channel(channel_id)}.")
-        self.data[ctx.guild.id]['channel'] = channel.id
-        return await ctx.send(f"The games channel is now set to {channel}")
+            return await ctx.send(f"The current games channels are {', '.join(channels)}.")
+        if channel.id in self.game_channels:
+            with self.con:
+                self.con.execute("DELETE FROM gamechannels WHERE channel_id = ?", (channel.id,))
+            self.game_channels.discard(channel.id)
+            return await ctx.send(f"{channel} is no longer a games channel.")
+        with self.con:
+            self.con.execute("INSERT INTO gamechannels(channel_id, guild_id) VALUES (?, ?)", (channel.id, ctx.guild.id))
+        self.game_channels.add(channel.id)
+        return await ctx.send(f"{channel} is now a games channel.")
 
     @commands.command()
     async def scoreboard(self, ctx, member: discord.Member=None):
@@ -94,26 +402,69 @@ class Games(commands.Cog, name='games'):
         If another 'member' is provided, their score would be provided instead.
         """
         member = member or ctx.author
-        await ctx.send(f"{member} has a score of {self.data[ctx.guild.id]['score'][member.id]}.")
+        score = self.get_score(ctx.guild.id, member.id)
+        if score is None:
+            return await ctx.send(f"{member} does not have a score in this server yet.")
+        await ctx.send(f"{member} has a score of {score}, and is ranked #{self.get_rank(ctx.guild.id, score)} in this server.")
+
+    @commands.command()
+    async def aroundme(self, ctx, member: discord.Member=None):
+        """
+        Return the people directly above and below you in the server's scoreboard.
+        If another 'member' is provided, the people around them are shown instead.
+        """
+        member = member or ctx.author
+        window = self.nearby_scores(ctx.guild.id, member.id, 3)
+        if window is None:
+            return await ctx.send(f"{member} does not have a score in this server yet.")
+        result = str()
+        for rank, user_id, score in window:
+            name = f"**{member}**" if user_id == member.id else str(self.bot.get_user(user_id))
+            result += f"{rank}. {name} - {score} points\n"
+        return await ctx.send(result)
 
     @commands.command()
     async def highscore(self, ctx, num: PositiveInt=5):
         """Return the top `num` people in the server in terms of score, up to 9 people."""
-        num = min(num, len(self.data[ctx.guild.id]['score']), 9)
-        if not num:
+        lst = self.top_scores(ctx.guild.id, min(num, 9))
+        if not lst:
             return await ctx.send("Nobody has a score yet.")
-        lst = sorted(self.data[ctx.guild.id]['score'].items(), key=lambda x:x[1], reverse=True)
         result = str()
-        for i in range(num):
-            result += f"{self.bot.get_user(lst[i][0])} - {lst[i][1]} points\n"
+        for user_id, score in lst:
+            result += f"{self.bot.get_user(user_id)} - {score} points\n"
         return await ctx.send(result)
 
     @commands.command()
     @commands.has_guild_permissions(manage_guild=True)
     async def changescore(self, ctx, num: int, *, user: discord.Member):
         """Change the score of a specified user."""
-        self.data[ctx.guild.id]['score'][user.id] += num
-        return await ctx.send(f"{user}'s score has been changed to {self.data[ctx.guild.id]['score'][user.id]}.")
+        self.add_scores(ctx.guild.id, {user.id: num})
+        return await ctx.send(f"{user}'s score has been changed to {self.get_score(ctx.guild.id, user.id)}.")
+
+    def record_times(self, guild_id: int, game: str, prompt: discord.Message, answers: typing.List[discord.Message]):
+        """Keep each user's best reaction time to `prompt` for the game."""
+        with self.con:
+            self.con.executemany("""INSERT INTO fastestfingers(guild_id, game, user_id, best_ms) VALUES (?, ?, ?, ?)
+                                    ON CONFLICT(guild_id, game, user_id) DO UPDATE SET best_ms = MIN(best_ms, excluded.best_ms)""",
+                                 ((guild_id, game, answer.author.id, reaction_ms(prompt, answer)) for answer in answers))
+
+    @commands.command()
+    async def fastest(self, ctx, game: str='fishing'):
+        """
+        Return the fastest reaction times in the server for a game, which can
+        be 'fishing' or 'fishwords'.
+        """
+        game = game.lower()
+        if game not in TIMED_GAMES:
+            raise GamesError("Reaction times are only recorded for 'fishing' and 'fishwords'.")
+        lst = self.con.execute("""SELECT user_id, best_ms FROM fastestfingers WHERE guild_id = ? AND game = ?
+                                  ORDER BY best_ms LIMIT 9""", (ctx.guild.id, game)).fetchall()
+        if not lst:
+            return await ctx.send("Nobody has a reaction time for that game yet.")
+        result = f"**Fastest Fingers ({game}):**\n"
+        for i, (user_id, best_ms) in enumerate(lst):
+            result += f"{self.word_placing[i]}: {self.bot.get_user(user_id)} - {best_ms / 1000:.3f}s\n"
+        return await ctx.send(result)
         
     ############################################################################
     #              Commands relating to helper function for games              #
@@ -130,18 +481,20 @@ class Games(commands.Cog, name='games'):
                 # Invalid subcommand passed
                 return await ctx.send("No such game exists.")
         else:
-            if ctx.channel.id != self.data[ctx.guild.id]['channel']:
-                raise GamesError("Games can only be played in the designated channel.")                
+            if ctx.channel.id not in self.game_channels:
+                raise GamesError("Games can only be played in the designated channels.")
     
-    def _existing_game(self, ctx):
-        if self.games_info[ctx.guild.id][1]:
-            raise GamesError("Only one game can be played at a time.")
-
-    async def signups_helper(self, ctx, game: str, minimum: int=2, maximum: int=50, rounds: int=1) -> bool:
-        """Helper function for signups. Returns `True` if game can start, `False` if cancelled. """
-        guild = ctx.guild.id #`guild` is actually the guild's id, but using guild to shorten the variable
+    def start_session(self, ctx) -> GameSession:
+        """Create the game session for the channel, if there is no existing game in the channel."""
+        if ctx.channel.id in self.sessions:
+            raise GamesError("Only one game can be played at a time in each channel.")
+        session = self.sessions[ctx.channel.id] = GameSession(ctx)
+        return session
+
+    async def signups_helper(self, ctx, game: str, minimum: int=2, maximum: int=50, rounds: int=1) -> typing.Optional[GameSession]:
+        """Helper function for signups. Returns the game session if game can start, `None` if cancelled. """
         # Check if there is an existing game
-        self._existing_game(ctx)
+        session = self.start_session(ctx)
 
         # Creation of embed to start signups
         embed = discord.Embed(title=f"Game of '{game.capitalize()}' by {ctx.author}",
@@ -149,79 +502,69 @@ class Games(commands.Cog, name='games'):
                               color=discord.Colour(random.randint(0, 16777215)))
         embed.add_field(name="Current Signups", value='None', inline=True)
         embed.set_footer(text=f"React ▶️ to close signups and start the game or react ⏹️ to cancel the game.\nOnly the host or server moderators can start or cancel the game.")
-        self.games_info[guild][0] = await ctx.send(embed=embed)
+        session.message = await ctx.send(embed=embed)
 
         reactions = ('🙋‍♂️', '▶️', '⏹️')
         for emoji in reactions:
-            await self.games_info[guild][0].add_reaction(emoji)
-        self.games_info[guild][1] = True
-        
-        # Not sure if it is a bug, but somehow the bot when it reacts the stop button,
-        # can stop the game. No idea how, but just to resolve it:
-        await asyncio.sleep(1)
-
-        # Wait for signal to start or cancel game
-        def stop_signups_check(reaction, user:discord.Member):
-            return (reaction.emoji in ['▶️', '⏹️']
-                    and reaction.message.id == self.games_info[guild][0].id
-                    and (user.id == ctx.author.id 
-                        or ctx.channel.permissions_for(user).manage_guild))
+            await session.message.add_reaction(emoji)
+        self.signup_messages[session.message.id] = session
+
+        # Wait for signal to start or cancel game, which is passed in by `on_reaction_add`
         while True:
-            signal, user = await self.bot.wait_for('reaction_add', check=stop_signups_check)
-            if signal.emoji == '▶️':
-                player_count = len(self.games_info[guild][2])
+            emoji, user = await session.signals.get()
+            if not (user.id == ctx.author.id or ctx.channel.permissions_for(user).manage_guild):
+                continue
+            if emoji == '▶️':
+                player_count = len(session.players)
                 # Check if number of players fits the requirement
                 if player_count >= minimum and player_count <= maximum:
-                    self.games_info[guild][1] = False # Ensure that number of players don't change
+                    del self.signup_messages[session.message.id] # Ensure that number of players don't change
+                    session.started = time.time()
                     await ctx.send(f"Request by {user}: Starting Game")
-                    return True
+                    return session
                 else:
                     await ctx.send(f"Recevied request to start game by {user}, but number of players does not meet requirement.")
-            elif signal.emoji == '⏹️':
+            elif emoji == '⏹️':
+                del self.signup_messages[session.message.id]
                 await ctx.send(f"Game cancelled by {user}.")
-                self.games_info[guild] = gamesDict()
-                return False
-            else:
-                raise Exception # Shouldn't happen by the nature of the above code
+                return None
     
-    async def embed_editor(self, guild):
+    def embed_editor(self, session: GameSession):
         """
-        This pools the updates together to prevent the bot from being rate limited.
-        The embed for the games signup message is updated 3 seconds after the
-        first signal to update is sent.
+        Update the signups embed with the current players. The edits are pooled
+        together by the bot's embed updater to prevent the bot from being rate
+        limited, and the embed is rendered when the edit is made.
         """
-        if self.embed_pooling:
-            return
-        self.embed_pooling = True
-        await asyncio.sleep(3.0)
-        current_embed = self.games_info[guild.id][0].embeds[0].to_dict()
-        current_embed['fields'][0]['value'] = '\n'.join(f'{p}' for p in self.games_info[guild.id][2]) or "None"
-        self.embed_pooling = False
-        await self.games_info[guild.id][0].edit(embed=discord.Embed.from_dict(current_embed))
+        def render():
+            current_embed = session.message.embeds[0].to_dict()
+            current_embed['fields'][0]['value'] = '\n'.join(f'{p}' for p in session.players) or "None"
+            return discord.Embed.from_dict(current_embed)
+        self.bot.embed_updater.request(session.message, render)
 
     @commands.Cog.listener()
     async def on_reaction_add(self, reaction, user):
-        if (self.games_info[user.guild.id][1] # Whether signups are open
-            and reaction.emoji == '🙋‍♂️' 
-            and reaction.message.id == self.games_info[user.guild.id][0].id):
-
-            self.games_info[user.guild.id][2].add(user)
-            return await self.embed_editor(user.guild)
+        # Only messages which are accepting signups are tracked
+        session = self.signup_messages.get(reaction.message.id)
+        if session is None or user.bot:
+            return
+        if reaction.emoji == '🙋‍♂️':
+            session.players.add(user)
+            self.embed_editor(session)
+        elif reaction.emoji in ('▶️', '⏹️'):
+            session.signals.put_nowait((reaction.emoji, user))
     
     @commands.Cog.listener()
     async def on_reaction_remove(self, reaction, user):
-        if (self.games_info[user.guild.id][1]
-            and reaction.emoji == '🙋‍♂️' 
-            and reaction.message.id == self.games_info[user.guild.id][0].id):
-            
-            self.games_info[user.guild.id][2].remove(user)
-            return await self.embed_editor(user.guild)
+        session = self.signup_messages.get(reaction.message.id)
+        if session is not None and reaction.emoji == '🙋‍♂️':
+            session.players.discard(user)
+            self.embed_editor(session)
 
     async def finish_game(self, ctx: commands.Context, score: dict):
         """
         Output the results of the game played in a scoreboard manner. This coroutine
-        automativally gives points to everyone in first place and clears the games
-        data in `self.games_info`. `ctx` should be the context of the signups message
+        automativally gives points to everyone in first place. The game session is
+        cleared once the command ends. `ctx` should be the context of the signups message
         and `score` should be a dictionary of `discord.Member`s as keys and `int`s
         as the repective values.
         """
@@ -251,13 +594,58 @@ class Games(commands.Cog, name='games'):
                       + '\n')
 
         # Give points to everyone in first place
-        for person in scoreboard[ranking_index[0]:ranking_index[1]]:
-            self.data[ctx.guild.id]['score'][person[0].id] += 1
+        winners = {person[0].id for person in scoreboard[ranking_index[0]:ranking_index[1]]}
+        self.add_scores(ctx.guild.id, dict.fromkeys(winners, 1))
+        self.record_game(ctx, score, winners)
 
         result += "Players in first place have earned one point each."
         await ctx.send(result)
-        # Clear the database
-        self.games_info[ctx.guild.id] = gamesDict()
+
+    def record_game(self, ctx: commands.Context, score: dict, winners: typing.Container[int]):
+        """
+        Add the finished game to the history, and update the statistics of
+        every player in a single transaction. Players who signed up but did
+        not score are recorded with a score of 0.
+        """
+        session = self.sessions.get(ctx.channel.id)
+        players = set(session.players) if session is not None else set()
+        results = {player.id: score.get(player, 0) for player in players | score.keys()}
+        started = session.started if session is not None and session.started is not None else time.time()
+        game = ctx.command.name
+
+        packed = array('q')
+        for user_id, points in results.items():
+            packed.extend((user_id, points))
+        with self.con:
+            self.con.execute("INSERT INTO gamehistory(guild_id, game, ended, duration, results) VALUES (?, ?, ?, ?, ?)",
+                             (ctx.guild.id, game, int(time.time()), int(time.time() - started), packed.tobytes()))
+            self.con.executemany("""INSERT INTO playerstats(guild_id, user_id, game, played, wins, total_score)
+                                    VALUES (?, ?, ?, 1, ?, ?)
+                                    ON CONFLICT(guild_id, user_id, game) DO UPDATE SET
+                                        played = played + 1,
+                                        wins = wins + excluded.wins,
+                                        total_score = total_score + excluded.total_score""",
+                                 ((ctx.guild.id, user_id, game, int(user_id in winners), points)
+                                  for user_id, points in results.items()))
+
+    @commands.command()
+    async def gamestats(self, ctx, member: discord.Member=None):
+        """
+        Return the user's games played, wins and average score for each game
+        in this server. If another 'member' is provided, their statistics
+        would be provided instead.
+        """
+        member = member or ctx.author
+        rows = self.con.execute("""SELECT game, played, wins, total_score FROM playerstats
+                                   WHERE guild_id = ? AND user_id = ? ORDER BY played DESC""",
+                                (ctx.guild.id, member.id)).fetchall()
+        if not rows:
+            return await ctx.send(f"{member} has not finished any games in this server.")
+        embed = discord.Embed(title=f"Game Statistics of {member}", color=discord.Colour.blue())
+        for game, played, wins, total_score in rows:
+            embed.add_field(name=game.capitalize(),
+                            value=f"Played: {played}\nWins: {wins}\nAverage Score: {total_score / played:.2f}")
+        return await ctx.send(embed=embed)
 
 
     ############################################################################
@@ -272,25 +660,30 @@ class Games(commands.Cog, name='games'):
         
         When each round starts, the bot will wait a random amount of time before
         sending a message that says "There is a tug on the fishing rod!". The
-        first player to type "catch" will receive a point for that round.
+        first player to type "catch" will receive a point for that round. The
+        first player is decided by when the messages were sent, not when the
+        bot received them.
         """
         # Start signups:
-        status = await self.signups_helper(ctx, 'fishing', rounds=num_rounds)
-        if not status:
+        session = await self.signups_helper(ctx, 'fishing', rounds=num_rounds)
+        if session is None:
             return None
 
         scoreboard = defaultdict(int)
         for i in range(num_rounds):
             await asyncio.sleep(5 * random.random() + 5)
-            await ctx.send(f"Round {i+1} of {num_rounds}: There is a tug on the fishing rod! Type 'catch' to catch the fish!")
+            prompt = await ctx.send(f"Round {i+1} of {num_rounds}: There is a tug on the fishing rod! Type 'catch' to catch the fish!")
 
             def catch_check(message):
                 return (message.content.lower() == "catch" 
-                        and message.author in self.games_info[ctx.guild.id][2])
+                        and message.author in session.players
+                        and message.id > prompt.id)
             try:
-                message = await self.bot.wait_for('message', check=catch_check, timeout=7)
+                answers = await session.collect_messages(catch_check, timeout=7)
+                self.record_times(ctx.guild.id, 'fishing', prompt, answers)
+                message = answers[0]
                 scoreboard[message.author] += 1
-                result = f"{message.author} caught the fish!\n"
+                result = f"{message.author} caught the fish in {reaction_ms(prompt, message) / 1000:.3f}s!\n"
             except asyncio.TimeoutError:
                 result = "Nobody caught the fish!\n"
             if i == num_rounds - 1:
@@ -313,7 +706,8 @@ class Games(commands.Cog, name='games'):
         receive points equal to the length of the word they typed.
         """
         # Start signups:
-        if not await self.signups_helper(ctx, 'fishing for words', rounds=num_rounds):
+        session = await self.signups_helper(ctx, 'fishing for words', rounds=num_rounds)
+        if session is None:
             return None
 
         def randWord(min_len=8, max_len=12):
@@ -328,15 +722,18 @@ class Games(commands.Cog, name='games'):
             await asyncio.sleep(5 * random.random() + 3)
             send_msg = f"Round {i+1} of {num_rounds}: Words are:**\n"
             words = tuple(randWord(min_length, max_length) for _ in range(random.randint(3, 5)))
-            await ctx.send(send_msg + '\n'.join(words) + '**')
+            prompt = await ctx.send(send_msg + '\n'.join(words) + '**')
 
             def catch_check(message):
                 return (message.content.lower() in words
-                        and message.author in self.games_info[ctx.guild.id][2])
+                        and message.author in session.players
+                        and message.id > prompt.id)
             try:
-                message = await self.bot.wait_for('message', check=catch_check, timeout=7)
+                answers = await session.collect_messages(catch_check, timeout=7)
+                self.record_times(ctx.guild.id, 'fishwords', prompt, answers)
+                message = answers[0]
                 scoreboard[message.author] += len(message.content)
-                result = f"{message.author} typed {message.content}!\n"
+                result = f"{message.author} typed {message.content} in {reaction_ms(prompt, message) / 1000:.3f}s!\n"
             except asyncio.TimeoutError:
                 result = "Nobody typed the words in time!\n"
             if i == num_rounds - 1:
@@ -347,17 +744,31 @@ class Games(commands.Cog, name='games'):
         return await self.finish_game(ctx, scoreboard)
 
     @commands.command()
-    async def hangman(self, ctx: commands.Context, category = None):
+    async def hangman(self, ctx: commands.Context, category = None, difficulty = None):
         """
         Starts a game of Hangman, Singaporean style. No signups is required.
         No points are given to the 'winner' of the game.
+
+        The difficulty can be 'easy', 'medium' or 'hard', based on the number
+        of different letters in the word.
+        Example: $hangman food hard
+        Example: $hangman easy
         """
-        # Check if there is an existing game
-        self._existing_game(ctx)
+        if ctx.channel.id not in self.game_channels:
+            raise GamesError("Games can only be played in the designated channels.")
+
+        # Allow the category to be left out when choosing a difficulty
+        if difficulty is None and category is not None and category.lower() in HANGMAN_DIFFICULTIES:
+            category, difficulty = None, category
+        if difficulty is not None:
+            difficulty = difficulty.lower()
+            if difficulty not in HANGMAN_DIFFICULTIES:
+                raise GamesError("Difficulty must be 'easy', 'medium' or 'hard'.")
 
         # Get hangman word from category
-        choice = self.hangman_choose(category)
-        self.games_info[ctx.guild.id][1] = True
+        choice = self.hangman_choose(category, difficulty)
+        # Check if there is an existing game
+        session = self.start_session(ctx)
         guessed = set()
         comparison = set()
         for letter in choice:
@@ -407,15 +818,13 @@ class Games(commands.Cog, name='games'):
             # Receive response
             def hangman_check(message: discord.Message):
                 content = message.content.lower()
-                return (message.channel.id == self.data[ctx.guild.id]['channel'] 
-                        and (content == choice 
-                            or len(content) == 1 
-                                and content.isalpha() 
-                                and content not in guessed
-                            )
+                return (content == choice 
+                        or len(content) == 1 
+                            and content.isalpha() 
+                            and content not in guessed
                        )
             try:
-                message = await self.bot.wait_for('message', check=hangman_check, timeout=120)
+                message = await session.wait_for_message(hangman_check, timeout=120)
             except asyncio.TimeoutError:
                 result = 'timeout'; break
             
@@ -441,119 +850,202 @@ class Games(commands.Cog, name='games'):
             await ctx.send(f"You lost! The word was `{choice}`!")
         elif result == "timeout":
             await ctx.send(f"Timeout. The word was `{choice}`!")
-        
-        # Clear the database
-        self.games_info[ctx.guild.id] = gamesDict()
-
-    def hangman_choose(self, category: str):
-        """Helper function to choose a word for hangman based on category."""
 
-        path = join('.', 'data', 'hangman')
-        if not isdir(path):
-            raise GamesError("No hangman folder detected in data folder.")
-        
+    def hangman_choose(self, category: str, difficulty: str=None):
+        """Helper function to choose a word for hangman based on category and difficulty."""
         if category is None:
-            # Check that there is at least one text file
-            categories = [f for f in listdir(path) if f.endswith('.txt')]
-            if not len(categories):
-                raise GamesError("No text files detect in hangman folder.")
-            path = join(path, random.choice(categories))
+            # Choose from the categories which have a word of that difficulty
+            categories = [c for c in self.word_bank.categories() if self.word_bank.get(c).count(difficulty)]
+            if not categories:
+                raise GamesError("No words detected in hangman folder.")
+            words = self.word_bank.get(random.choice(categories))
         else:
-            # Check that the category text file exists
-            path = join(path, category + '.txt')
-            if not isfile(path):
-                raise GamesError("That category does not exist.")
-
-        with open(path, 'r') as f:
-            words = f.readlines()
-        return random.choice(words).strip().lower()
+            words = self.word_bank.get(category.lower())
+            if not words.count(difficulty):
+                raise GamesError("That category has no words of that difficulty.")
+        return words.choose(difficulty)
 
     @commands.command()
     async def hangmanlist(self, ctx):
         """Shows the list of available hangman categories."""
-        path = join('.', 'data', 'hangman')
-        if not isdir(path):
-            raise GamesError("No hangman folder detected in data folder.")
-        categories = [f[:-4] for f in listdir(path) if f.endswith('.txt')]
-
         embed = discord.Embed(title="Hangman Categories",
-                              description='\n'.join(categories), 
+                              description='\n'.join(self.word_bank.categories()),
                               color=discord.Colour.blue())
         await ctx.send(embed=embed)
 
 
 
-    # @signups.command(name='connect4', aliases=['connectfour'])
-    # async def _signups_connect4(self, ctx):
-    #     """
-    #     Starts a game of Connect Four.
+    @signups.command(name='trivia')
+    async def _signups_trivia(self, ctx, num_rounds: PositiveInt=10, category=None, difficulty=None):
+        """
+        Starts a game of trivia with a specified number of rounds.
 
-    #     Exactly two players is required to play this game.
-    #     Player who initiated the signups will go first.
-    #     """
-    #     raise NotImplementedError
-    #     # Start Signups
-    #     if not await self.signups_helper(ctx, 'Connect 4', maximum=2):
-    #         return None
-        
-    #     # Decides who goes first
-    #     convert = commands.MemberConverter().convert
-    #     async def check(message):
-    #         return (message.author in self.games_info[ctx.guild.id][2] and
-    #                 await convert(ctx, message.content) in self.games_info[ctx.guild.id][2])
-    #     try:
-    #         await ctx.send("Out of the two players, who should go first? Mention their name.")
-    #         message = await self.bot.wait_for('message', check=check, timeout=60)
-    #     except asyncio.TimeoutError:
-    #         return await ctx.send("No response detected. Game cancelled.\n")
-
-    #     # Information required by game
-    #     blank = ':black_large_square:'
-    #     red = ':red_square:' # Player 1
-    #     blue = ':blue_square:' # Player 2
-    #     gameboard = [[blank] * 7] * 6
-    #     player1 = convert(ctx, message.content)
-    #     players = [player1,
-    #                (self.games_info[ctx.guild.id][2] - {player1}).pop()]
-    #     del player1
-
-    #     def displayboard_text():
-    #         """Send the current game board into the chat."""
-    #         send = ":regional_indicator_a: :regional_indicator_b: :regional_indicator_c: :regional_indicator_d: :regional_indicator_e: :regional_indicator_f: :regional_indicator_g:\n"
-    #         for row in gameboard:
-    #             send += ' '.join(row) + '\n'
-    #         return send
-
-    #     # Start Game
-    #     current_player = 0
-    #     counter = defaultdict(int)
-    #     def check_message(message):
-    #         return (message.author == players[current_player] and
-    #                 message.content.lower() in ('a', 'b', 'c', 'd', 'e', 'f', 'g', 'surrender'))
-
-    #     while True:
-    #         await ctx.send(displayboard_text() + f"{players[current_player]}'s turn. Type which column you want to drop the token, or 'surrender' to lose.")
-    #         second_time = False
-
-    #         while True:
-    #             try:
-    #                 message = await self.bot.wait_for('message', check=check_message, timeout=30)
-    #                 content = message.content.lower()
-    #             except asyncio.TimeoutError:
-    #                 if second_time:
-    #                     # Consider it as surrender
-    #                     content = 'surrender'
-    #                     break
-    #                 second_time = True
-    #                 ctx.send(f"{players[current_player].mention}, you have 30s left to make a response.")
-
-    #             if content == 'surrender':
-    #                 await ctx.send(f"{players[current_player].mention} has surrendered.")
-    #                 break
-    #             elif counter[content] < 6:
-    #                 counter[content] += 1
-    #         break
-    #     pass
+        Questions can be limited to a category and/or a difficulty, which can
+        be 'easy', 'medium' or 'hard'. The first player to type the correct
+        answer to each question receives a point. Small typos in longer
+        answers are accepted.
+        Example: $signups trivia 10 history hard
+        """
+        bank = self.question_bank
+        # Allow the category to be left out when choosing a difficulty
+        if difficulty is None and category is not None and category.lower() in trivia.DIFFICULTIES:
+            category, difficulty = None, category
+        category = category.lower() if category is not None else None
+        difficulty = difficulty.lower() if difficulty is not None else None
+        if difficulty is not None and difficulty not in trivia.DIFFICULTIES:
+            raise GamesError("Difficulty must be 'easy', 'medium' or 'hard'.")
+        if not bank.count(category, difficulty):
+            raise GamesError("There are no trivia questions for that category and difficulty.")
+
+        # Start signups
+        session = await self.signups_helper(ctx, 'trivia', minimum=1, rounds=num_rounds)
+        if session is None:
+            return None
+
+        asked = set()
+        upcoming = asyncio.ensure_future(bank.run(self.bot.loop, bank.sample, category, difficulty, asked))
+        scoreboard = defaultdict(int)
+        try:
+            for i in range(num_rounds):
+                question = await upcoming
+                asked.add(question.id)
+                # Fetch the next question while this one is being answered
+                if i < num_rounds - 1:
+                    upcoming = asyncio.ensure_future(bank.run(self.bot.loop, bank.sample, category, difficulty, asked))
+
+                embed = discord.Embed(title=f"Round {i+1} of {num_rounds}: {question.category.capitalize()} ({question.difficulty})",
+                                      description=question.question,
+                                      color=discord.Colour.blue())
+                embed.set_footer(text=f"You have {TRIVIA_ANSWER_TIME} seconds to answer.")
+                await ctx.send(embed=embed)
+
+                def answer_check(message):
+                    return (message.author in session.players
+                            and trivia.is_correct(trivia.normalise(message.content), question.normalised))
+                try:
+                    message = await session.wait_for_message(answer_check, timeout=TRIVIA_ANSWER_TIME)
+                    scoreboard[message.author] += 1
+                    result = f"{message.author} got it! The answer was **{question.answer}**.\n"
+                except asyncio.TimeoutError:
+                    result = f"Time's up! The answer was **{question.answer}**.\n"
+                if i == num_rounds - 1:
+                    await ctx.send(result + "Ending the game...")
+                else:
+                    await ctx.send(result + "Moving to the next round...")
+                    await asyncio.sleep(3)
+        finally:
+            upcoming.cancel()
+
+        return await self.finish_game(ctx, scoreboard)
+
+    @commands.command()
+    async def triviacategories(self, ctx):
+        """Shows the list of trivia categories and the number of questions in each."""
+        categories = self.question_bank.categories()
+        embed = discord.Embed(title="Trivia Categories",
+                              description='\n'.join(f"{category} - {count} questions" for category, count in sorted(categories.items()))
+                                          or "There are no trivia questions.",
+                              color=discord.Colour.blue())
+        await ctx.send(embed=embed)
+
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def triviaimport(self, ctx):
+        """
+        Owner-only command to add trivia questions from an attached CSV file,
+        with columns of category, difficulty, question and answer.
+        """
+        if not ctx.message.attachments:
+            raise GamesError("Attach a CSV file of questions to import.")
+        text = (await ctx.message.attachments[0].read()).decode('utf-8-sig')
+        rows = list()
+        for line, row in enumerate(csv.reader(io.StringIO(text)), 1):
+            if len(row) != 4 or row[1].strip().lower() not in trivia.DIFFICULTIES:
+                raise GamesError(f"Line {line} of the file is not a valid question.")
+            category, difficulty, question, answer = (field.strip() for field in row)
+            rows.append((category.lower(), difficulty.lower(), question, answer))
+        bank = self.question_bank
+        added = await bank.run(self.bot.loop, bank.add_questions, rows)
+        await ctx.send(f"Added {added} trivia questions.")
+
+    @signups.command(name='connect4', aliases=['connectfour'])
+    async def _signups_connect4(self, ctx):
+        """
+        Starts a game of Connect Four.
+
+        One or two players can sign up. If only one player signs up, they
+        will play against the bot. The host goes first if they signed up.
+
+        Players take turns to type the letter of the column to drop their
+        token in, or 'surrender' to lose.
+        """
+        # Start Signups
+        session = await self.signups_helper(ctx, 'Connect 4', minimum=1, maximum=2)
+        if session is None:
+            return None
+
+        # Decides who goes first. `None` represents the bot.
+        players = list(session.players)
+        random.shuffle(players)
+        players.sort(key=lambda player: player != ctx.author)
+        if len(players) == 1:
+            players.append(None)
+
+        # Information required by game
+        blank = '⚫'
+        tokens = ('🔴', '🔵')
+        letters = 'abcdefg'
+        header = ' '.join(f':regional_indicator_{letter}:' for letter in letters)
+        board = connect4.Board()
+        winner = None
+
+        while True:
+            current = board.moves % 2
+            if players[current] is None:
+                # Search in a worker process so that the event loop is not blocked
+                if self.executor is None:
+                    self.executor = ProcessPoolExecutor(max_workers=1)
+                col = await self.bot.loop.run_in_executor(self.executor, connect4.best_move, board.position,
+                                                          board.mask, board.moves, CONNECT4_AI_BUDGET)
+                await ctx.send(f"The bot drops its token in column {letters[col].upper()}.")
+            else:
+                await ctx.send(f"{header}\n{board.render(tokens, blank)}\n{tokens[current]} {players[current].mention}'s turn. "
+                               "Type which column you want to drop the token, or 'surrender' to lose.")
+
+                def check_message(message):
+                    content = message.content.lower()
+                    return (message.author == players[current]
+                            and (content == 'surrender'
+                                 or len(content) == 1 and content in letters and board.can_play(letters.index(content))))
+                try:
+                    content = (await session.wait_for_message(check_message, timeout=60)).content.lower()
+                except asyncio.TimeoutError:
+                    await ctx.send(f"{players[current].mention} took too long to make a move.")
+                    content = 'surrender'
+
+                if content == 'surrender':
+                    await ctx.send(f"{players[current]} has surrendered.")
+                    winner = 1 - current
+                    break
+                col = letters.index(content)
+
+            if board.play(col):
+                winner = current
+                break
+            if board.is_full():
+                break
+
+        await ctx.send(f"{header}\n{board.render(tokens, blank)}")
+        if winner is None or players[winner] is None:
+            # No points are given for a draw or for losing to the bot, but the game is still recorded
+            self.record_game(ctx, {player: 0 for player in players if player is not None}, ())
+            if winner is None:
+                return await ctx.send("The board is full. It's a draw!")
+            return await ctx.send("The bot wins!")
+        await ctx.send(f"{players[winner]} wins!")
+
+        humans = [player for player in players if player is not None]
+        return await self.finish_game(ctx, {player: int(idx == winner) for idx, player in enumerate(players) if player in humans})
 
     # @signups.command(name='aitp', aliases=['assassininthepalace'])
     # async def _signups_aith(self, ctx):
@@ -2,7 +2,15 @@ import logging
 import typing
 import re
 import sqlite3
+import asyncio
+import inspect
+import hashlib
+import json
+from collections import namedtuple
+from os import makedirs, replace
+from os.path import join, isfile
 
+import aiohttp
 import discord
 from discord.ext import commands
 
@@ -166,3 +174,155 @@ async def smart_send(target: discord.abc.Messageable, msg, sep=2000) -> typing.U
 def error_embed(message: str, *, error="Error") -> discord.Embed:
     """Helper function to produce an error embed."""
     return discord.Embed(title=error, description = message, colour=discord.Colour.red())
+
+class EmbedUpdater:
+    """
+    Debounces embed edits to messages. Any number of edit requests for the same
+    message within the interval results in a single `message.edit`. The embed
+    is rendered when the edit is made, so it always reflects the latest state.
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop, interval: float=3.0):
+        self.loop = loop
+        self.interval = interval
+        self.pending = dict() # message ID => (message, render function)
+        self.tasks = dict() # message ID => task which will edit the message
+        self.edits = 0 # Number of edits made
+        self.saved = 0 # Number of edit requests merged into another edit
+
+    def request(self, message: discord.Message, render: typing.Callable, *, interval: float=None):
+        """
+        Request for the message to be edited with the embed returned by
+        `render`, which can be a function or a coroutine function. The edit is
+        made `interval` seconds after the first request since the last edit.
+        `message` only needs to have `id` and `edit`, so a partial message works.
+        """
+        if message.id in self.pending:
+            self.saved += 1
+        else:
+            self.tasks[message.id] = self.loop.create_task(self._flush(message.id, self.interval if interval is None else interval))
+        self.pending[message.id] = (message, render)
+
+    def cancel(self, message_id: int):
+        """Drop any pending edit for the message."""
+        self.pending.pop(message_id, None)
+        task = self.tasks.pop(message_id, None)
+        if task is not None:
+            task.cancel()
+
+    async def _flush(self, message_id: int, delay: float):
+        await asyncio.sleep(delay)
+        message, render = self.pending.pop(message_id)
+        del self.tasks[message_id]
+        try:
+            embed = render()
+            if inspect.isawaitable(embed):
+                embed = await embed
+            await message.edit(embed=embed)
+            self.edits += 1
+        except discord.HTTPException as e:
+            logging.error(f"Unable to edit message {message_id}. Error {e}")
+
+class ReactionRegistry:
+    """
+    Messages which cogs track reactions on, mapped to the handler for each
+    message. Raw reaction events are dispatched with a single lookup, so
+    reactions on untracked messages cost nothing else. Cogs register their
+    tracked messages when loaded, usually from their tables, and unregister
+    them when unloaded.
+    """
+    def __init__(self):
+        self.handlers = dict() # Message ID => handler(payload, added)
+
+    def register(self, message_id: int, handler: typing.Callable):
+        """
+        Track reactions on the message. `handler` is called with the raw
+        reaction payload and whether the reaction was added, and can be a
+        function or a coroutine function.
+        """
+        self.handlers[message_id] = handler
+
+    def unregister(self, message_id: int):
+        self.handlers.pop(message_id, None)
+
+    async def dispatch(self, payload: discord.RawReactionActionEvent, added: bool):
+        handler = self.handlers.get(payload.message_id)
+        if handler is None:
+            return
+        result = handler(payload, added)
+        if inspect.isawaitable(result):
+            await result
+
+CachedResponse = namedtuple('CachedResponse', ('body', 'modified'))
+
+def _write_atomic(path: str, data: bytes):
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    replace(path + '.tmp', path)
+
+class HttpClient:
+    """
+    A single pooled HTTP session shared by the cogs. GET requests are made
+    conditionally with the ETag and Last-Modified of the last response, and
+    responses are cached on disk so that the cache survives restarts. Cache
+    files are written in a worker thread so the event loop is not blocked.
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop, cache_dir: str):
+        self.loop = loop
+        self.cache_dir = cache_dir
+        self.session = None # aiohttp.ClientSession, created when first needed in the event loop
+        self.cache = dict() # URL => (validators, body) of the last response
+        makedirs(cache_dir, exist_ok=True)
+
+    def _cache_path(self, url: str) -> str:
+        return join(self.cache_dir, hashlib.sha1(url.encode()).hexdigest())
+
+    def _read_cache(self, url: str) -> typing.Optional[typing.Tuple[dict, bytes]]:
+        path = self._cache_path(url)
+        if not (isfile(path + '.json') and isfile(path + '.body')):
+            return None
+        with open(path + '.json', 'r') as f:
+            validators = json.load(f)
+        with open(path + '.body', 'rb') as f:
+            return validators, f.read()
+
+    def _write_cache(self, url: str, validators: dict, body: bytes):
+        # The body is written first, so that the validators never refer to a missing body
+        path = self._cache_path(url)
+        _write_atomic(path + '.body', body)
+        _write_atomic(path + '.json', json.dumps(validators).encode())
+
+    async def get(self, url: str, **kwargs) -> CachedResponse:
+        """
+        GET the URL, returning the body and whether it changed since the last
+        request. If the server responds with 304 Not Modified, the cached body
+        is returned instead. Other error responses raise `aiohttp.ClientResponseError`.
+        """
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+        if url not in self.cache:
+            cached = await self.loop.run_in_executor(None, self._read_cache, url)
+            if cached is not None:
+                self.cache[url] = cached
+
+        headers = kwargs.pop('headers', dict())
+        validators, body = self.cache.get(url, (dict(), None))
+        if 'etag' in validators:
+            headers['If-None-Match'] = validators['etag']
+        if 'last_modified' in validators:
+            headers['If-Modified-Since'] = validators['last_modified']
+
+        async with self.session.get(url, headers=headers, **kwargs) as response:
+            if response.status == 304 and body is not None:
+                return CachedResponse(body, False)
+            response.raise_for_status()
+            body = await response.read()
+            validators = {key: response.headers[header] for key, header in (('etag', 'ETag'), ('last_modified', 'Last-Modified'))
+                          if header in response.headers}
+
+        self.cache[url] = (validators, body)
+        await self.loop.run_in_executor(None, self._write_cache, url, validators, body)
+        return CachedResponse(body, True)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
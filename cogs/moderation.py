@@ -1,13 +1,15 @@
-from datetime import datetime, timedelta
-from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from collections import defaultdict, namedtuple
 import logging
 import typing
 import asyncio
+import json
+import zlib
 
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 
-from cogs.helper import Duration, PositiveInt, smart_send
+from cogs.helper import Duration, PositiveInt, smart_send, addColumn
 
 
 class BannedUser(commands.Converter):
@@ -25,6 +27,26 @@ class BannedUser(commands.Converter):
 class ModerationError(commands.CommandError):
     pass
 
+# Columns of a modlog row needed to render a case
+CASE_COLUMNS = ('case_id', 'moderator', 'moderator_id', 'user', 'user_id', 'timestamp',
+                'type', 'duration', 'reason', 'log_channel_id', 'log_message_id')
+Case = namedtuple('Case', CASE_COLUMNS)
+
+# Completed modlog rows older than this many days are moved to the archive table
+ARCHIVE_AFTER_DAYS = 90
+# Rows moved per transaction, and the maximum number of transactions per archival run
+ARCHIVE_CHUNK_SIZE = 500
+ARCHIVE_MAX_CHUNKS = 20
+
+# Audit log actions which are ingested into the modlog, and their modlog types
+AUDIT_LOG_TYPES = {
+    discord.AuditLogAction.ban: 'ban',
+    discord.AuditLogAction.unban: 'unban',
+    discord.AuditLogAction.kick: 'kick',
+}
+# Maximum number of audit log entries requested per guild per poll
+AUDIT_LOG_LIMIT = 100
+
 class Moderation(commands.Cog, name='moderation'):
 
     def __init__(self, bot: commands.Bot):
@@ -51,10 +73,44 @@ class Moderation(commands.Cog, name='moderation'):
                                 channel_id      INTEGER,
                                 role_id         INTEGER)""")
 
+        # Columns added after the initial schema. `last_case` is the per-guild
+        # case counter, and the log columns point to the case's message in the
+        # modlog channel so that it can be edited without a history search.
+        addColumn(self.con, 'moderationsettings', 'last_case INTEGER NOT NULL DEFAULT 0')
+        addColumn(self.con, 'modlog', 'case_id INTEGER')
+        addColumn(self.con, 'modlog', 'log_channel_id INTEGER')
+        addColumn(self.con, 'modlog', 'log_message_id INTEGER')
+        # ID of the newest audit log entry ingested for the guild
+        addColumn(self.con, 'moderationsettings', 'audit_cursor INTEGER')
+        self.assign_missing_case_ids()
+        self.con.execute("CREATE UNIQUE INDEX IF NOT EXISTS modlog_case_idx ON modlog(guild_id, case_id)")
+        self.con.execute("CREATE INDEX IF NOT EXISTS modlog_user_idx ON modlog(guild_id, user_id, timestamp)")
+        self.con.execute("CREATE INDEX IF NOT EXISTS modlog_complete_idx ON modlog(complete, timestamp)")
+
+        # Only actions with a pending automatic unmute or unban are incomplete.
+        # Older versions left warns, kicks and notes incomplete forever.
+        self.con.execute("UPDATE modlog SET complete = 1 WHERE complete = 0 AND (duration IS NULL OR duration <= 0)")
+
+        # Cold storage for old completed cases. Everything except the columns
+        # used for lookups is stored as compressed JSON in `data`.
+        self.con.execute("""CREATE TABLE IF NOT EXISTS modlog_archive (
+                                guild_id        INTEGER NOT NULL,
+                                case_id         INTEGER NOT NULL,
+                                user_id         INTEGER NOT NULL,
+                                timestamp       TIMESTAMP NOT NULL,
+                                data            BLOB NOT NULL,
+                                PRIMARY KEY(guild_id, case_id))""")
+        self.con.execute("CREATE INDEX IF NOT EXISTS modlog_archive_user_idx ON modlog_archive(guild_id, user_id, timestamp)")
+        self.con.commit()
+
         # Loads up the entire database and starts running tasks
         self.loop.create_task(self.restart_tasks())
+        self.archive_modlog.start()
+        self.ingest_audit_logs.start()
     
     def cog_unload(self):
+        self.archive_modlog.cancel()
+        self.ingest_audit_logs.cancel()
         for server in self.ongoing.values():
             for task in server.values():
                 task.cancel()
@@ -222,6 +278,143 @@ class Moderation(commands.Cog, name='moderation'):
         # See explanation for the and statements above in the modlog channel section
         return role_id_tuple and role_id_tuple[0] and guild.get_role(role_id_tuple[0])
 
+    def assign_missing_case_ids(self):
+        """Number the rows logged before case IDs existed, in the order they were logged."""
+        missing = self.con.execute("SELECT DISTINCT guild_id FROM modlog WHERE case_id IS NULL").fetchall()
+        with self.con:
+            for guild_id, in missing:
+                rowids = [r[0] for r in self.con.execute("""SELECT rowid FROM modlog
+                                                            WHERE guild_id = ? AND case_id IS NULL
+                                                            ORDER BY timestamp, rowid""", (guild_id,))]
+                first = self.next_case_ids(guild_id, len(rowids))
+                self.con.executemany("UPDATE modlog SET case_id = ? WHERE rowid = ?",
+                                     ((first + i, rowid) for i, rowid in enumerate(rowids)))
+
+    def next_case_ids(self, guild_id: int, count: int=1) -> int:
+        """
+        Reserve `count` consecutive case IDs for the guild and return the first
+        one. This should be called in the same transaction as the insertion of
+        the modlog rows, so that IDs are never skipped or repeated.
+        """
+        self.con.execute("""INSERT INTO moderationsettings(guild_id, last_case) VALUES (?, ?)
+                            ON CONFLICT(guild_id) DO UPDATE SET last_case = last_case + excluded.last_case""",
+                            (guild_id, count))
+        last, = self.con.execute("SELECT last_case FROM moderationsettings WHERE guild_id = ?", (guild_id,)).fetchone()
+        return last - count + 1
+
+    def insert_cases(self, guild_id: int, rows: typing.List[tuple]) -> int:
+        """
+        Insert modlog rows for the guild and return the case ID of the first
+        row. Each row is a tuple of (moderator, moderator_id, user, user_id,
+        timestamp, type, duration, reason, complete). Should be called inside
+        a transaction.
+        """
+        first = self.next_case_ids(guild_id, len(rows))
+        self.con.executemany("""INSERT INTO modlog(guild_id, case_id, moderator, moderator_id,
+                                                   user, user_id, timestamp,
+                                                   type, duration, reason, complete)
+                                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                            ((guild_id, first + i, *row) for i, row in enumerate(rows)))
+        return first
+
+    def get_case(self, guild_id: int, case_id: int) -> typing.Optional[Case]:
+        """Return the case with the given ID in the guild, or None if it does not exist."""
+        row = self.con.execute(f"""SELECT {', '.join(CASE_COLUMNS)} FROM modlog
+                                   WHERE guild_id = ? AND case_id = ?""", (guild_id, case_id)).fetchone()
+        if row is not None:
+            return Case(*row)
+        row = self.con.execute("""SELECT case_id, user_id, timestamp, data FROM modlog_archive
+                                  WHERE guild_id = ? AND case_id = ?""", (guild_id, case_id)).fetchone()
+        return row and unpack_archived(*row)
+
+    def set_case_reason(self, guild_id: int, case_id: int, reason: str) -> bool:
+        """Change the reason of a case. Returns `False` if the case does not exist."""
+        with self.con:
+            if self.con.execute("UPDATE modlog SET reason = ? WHERE guild_id = ? AND case_id = ?",
+                                (reason, guild_id, case_id)).rowcount:
+                return True
+            row = self.con.execute("""SELECT case_id, user_id, timestamp, data FROM modlog_archive
+                                      WHERE guild_id = ? AND case_id = ?""", (guild_id, case_id)).fetchone()
+            if row is None:
+                return False
+            self.con.execute("UPDATE modlog_archive SET data = ? WHERE guild_id = ? AND case_id = ?",
+                             (pack_archived(unpack_archived(*row)._replace(reason=reason)), guild_id, case_id))
+            return True
+
+    def search_cases(self, guild_id: int, user_id: int, number: int, filter_: str='') -> typing.List[Case]:
+        """
+        Return up to `number` of the user's most recent cases, newest first,
+        whose type or reason contains `filter_`. Both the modlog and the
+        archive are searched.
+        """
+        # Searching in sqlite is case-insensitive
+        search = '%' + filter_ + '%'
+        cases = [Case(*row) for row in self.con.execute(f"""SELECT {', '.join(CASE_COLUMNS)} FROM modlog
+                                                            WHERE guild_id = ?
+                                                                AND user_id = ?
+                                                                AND (type LIKE ? OR reason LIKE ?)
+                                                            ORDER BY timestamp DESC
+                                                            LIMIT ?""",
+                                                        (guild_id, user_id, search, search, number))]
+
+        # Archived rows can only be filtered after decompressing them
+        filter_ = filter_.lower()
+        archived = 0
+        for row in self.con.execute("""SELECT case_id, user_id, timestamp, data FROM modlog_archive
+                                       WHERE guild_id = ? AND user_id = ?
+                                       ORDER BY timestamp DESC""", (guild_id, user_id)):
+            case = unpack_archived(*row)
+            if filter_ in case.type.lower() or filter_ in (case.reason or '').lower():
+                cases.append(case)
+                archived += 1
+                if archived == number:
+                    break
+
+        cases.sort(key=lambda case: case.timestamp, reverse=True)
+        return cases[:number]
+
+    def archive_chunk(self, cutoff: datetime) -> int:
+        """
+        Move up to `ARCHIVE_CHUNK_SIZE` completed cases logged before `cutoff`
+        into the archive in one transaction. Returns the number of rows moved.
+        """
+        rows = self.con.execute(f"""SELECT rowid, guild_id, {', '.join(CASE_COLUMNS)} FROM modlog
+                                    WHERE complete = 1 AND timestamp < ?
+                                    LIMIT ?""", (cutoff, ARCHIVE_CHUNK_SIZE)).fetchall()
+        archived = list()
+        for row in rows:
+            case = Case(*row[2:])
+            archived.append((row[1], case.case_id, case.user_id, case.timestamp, pack_archived(case)))
+        with self.con:
+            self.con.executemany("INSERT OR REPLACE INTO modlog_archive VALUES (?, ?, ?, ?, ?)", archived)
+            self.con.executemany("DELETE FROM modlog WHERE rowid = ?", ((row[0],) for row in rows))
+        return len(rows)
+
+    @tasks.loop(hours=1)
+    async def archive_modlog(self):
+        """Periodically move old completed cases out of the modlog table in bounded chunks."""
+        cutoff = datetime.now() - timedelta(days=ARCHIVE_AFTER_DAYS)
+        total = 0
+        for _ in range(ARCHIVE_MAX_CHUNKS):
+            moved = self.archive_chunk(cutoff)
+            total += moved
+            if moved < ARCHIVE_CHUNK_SIZE:
+                break
+            await asyncio.sleep(1) # Let other tasks use the database between chunks
+        if total:
+            logging.info(f"Archived {total} modlog rows.")
+
+    def case_embed(self, case: Case) -> discord.Embed:
+        """Render the embed of a case from its modlog row."""
+        d = 'NA' if case.duration is None else ('Forever' if case.duration == -1 else f'{case.duration} Minutes')
+        embed = discord.Embed(title=f"Case {case.case_id} | {case.type.capitalize()} | {case.user}", colour=discord.Colour.blue())
+        embed.add_field(name="Moderator", value=f"<@{case.moderator_id}>", inline=True)
+        embed.add_field(name="User", value=f"<@{case.user_id}>", inline=True)
+        embed.add_field(name="Duration", value=d, inline=True)
+        embed.add_field(name="Reason", value=case.reason, inline=False)
+        embed.set_footer(text=f"User ID: {case.user_id} | {case.timestamp}")
+        return embed
+
     async def log(self, guild: discord.Guild, moderator: discord.Member,
                   user: discord.abc.User, type_: str, reason: str,
                   duration: int=None, *, broadcast=True, send_user=True):
@@ -235,30 +428,25 @@ class Moderation(commands.Cog, name='moderation'):
         """
         # Update database
         time = datetime.now()
-        complete = 1 if duration == -1 else 0
+        complete = 0 if duration is not None and duration > 0 else 1
         with self.con:
-            self.con.execute("""INSERT INTO modlog(guild_id, moderator, moderator_id,
-                                                   user, user_id, timestamp,
-                                                   type, duration, reason, complete)
-                                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                            (guild.id, str(moderator), moderator.id, str(user), 
-                            user.id, time, type_, duration, reason, complete))
+            case_id = self.insert_cases(guild.id, [(str(moderator), moderator.id, str(user), user.id,
+                                                    time, type_, duration, reason, complete)])
 
         # Creation of embed
-        d = 'NA' if duration is None else ('Forever' if duration == -1 else f'{duration} Minutes')
-        embed = discord.Embed(title=f"{type_.capitalize()} | {user}", colour=discord.Colour.blue())
+        embed = self.case_embed(Case(case_id, str(moderator), moderator.id, str(user), user.id,
+                                     time, type_, duration, reason, None, None))
         embed.set_thumbnail(url=user.avatar_url)
-        embed.add_field(name="Moderator", value=moderator.mention, inline=True)
-        embed.add_field(name="User", value=user.mention, inline=True)
-        embed.add_field(name="Duration", value=d, inline=True)
-        embed.add_field(name="Reason", value=reason, inline=False)
-        embed.set_footer(text=f"User ID: {user.id} | {time}")
 
         # Broadcast to modlog channel and user if applicable
         if broadcast:
             modlogchannel = await self.getmodlogchannel(guild)
             if modlogchannel is not None:
-                await modlogchannel.send(embed=embed)
+                logmessage = await modlogchannel.send(embed=embed)
+                with self.con:
+                    self.con.execute("""UPDATE modlog SET log_channel_id = ?, log_message_id = ?
+                                        WHERE guild_id = ? AND case_id = ?""",
+                                        (modlogchannel.id, logmessage.id, guild.id, case_id))
             if send_user:
                 await user.send(embed=embed)
         return embed
@@ -294,6 +482,70 @@ class Moderation(commands.Cog, name='moderation'):
             self.update_modlog(guild.id, user.id)
             del self.ongoing[guild][user]
 
+    @tasks.loop(minutes=5)
+    async def ingest_audit_logs(self):
+        """Periodically log bans, unbans and kicks made outside of the bot."""
+        for guild in self.bot.guilds:
+            if not guild.me.guild_permissions.view_audit_log:
+                continue
+            try:
+                await self.ingest_audit_log(guild)
+            except discord.HTTPException as e:
+                logging.warning(f"Unable to read the audit log of {guild}: {e}")
+
+    @ingest_audit_logs.before_loop
+    async def before_ingest_audit_logs(self):
+        await self.bot.wait_until_ready()
+
+    async def ingest_audit_log(self, guild: discord.Guild):
+        """
+        Log the guild's audit log entries made since the last poll. Entries
+        made by the bot itself are skipped, as they have already been logged.
+        """
+        row = self.con.execute("SELECT audit_cursor FROM moderationsettings WHERE guild_id = ?", (guild.id,)).fetchone()
+        if row is None or row[0] is None:
+            # First poll for this guild, so only ingest entries from now on
+            cursor = discord.utils.time_snowflake(datetime.utcnow())
+        else:
+            cursor = row[0]
+
+        rows = list()
+        unbanned = list()
+        newest = cursor
+        # The library ignores `after` for audit logs, so entries are read newest
+        # first and the scan stops at the first entry which was already seen
+        async for entry in guild.audit_logs(limit=AUDIT_LOG_LIMIT):
+            if entry.id <= cursor:
+                break
+            newest = max(newest, entry.id)
+            type_ = AUDIT_LOG_TYPES.get(entry.action)
+            if type_ is None or entry.user.id == self.bot.user.id:
+                continue
+            user = entry.target
+            # Audit log timestamps are naive UTC, while the modlog uses naive local time
+            time = entry.created_at.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+            duration = -1 if type_ == 'ban' else None
+            rows.append((str(entry.user), entry.user.id, str(user) if isinstance(user, discord.abc.User) else f"User {user.id}",
+                         user.id, time, type_, duration, entry.reason or '-', 1))
+            if type_ == 'unban':
+                unbanned.append(user)
+        # Cases are numbered in the order the actions were made
+        rows.reverse()
+        unbanned.reverse()
+
+        with self.con:
+            if rows:
+                self.insert_cases(guild.id, rows)
+            self.con.execute("""INSERT INTO moderationsettings(guild_id, audit_cursor) VALUES (?, ?)
+                                ON CONFLICT(guild_id) DO UPDATE SET audit_cursor=excluded.audit_cursor""",
+                                (guild.id, newest))
+        if rows:
+            logging.info(f"Ingested {len(rows)} audit log entries from {guild}.")
+
+        # A manual unban replaces any scheduled automatic unban
+        for user in unbanned:
+            self.cancel_task(guild, user)
+
     @commands.Cog.listener()
     async def on_member_remove(self, member: discord.Member):
         """Track when a member leaves the guild."""
@@ -486,27 +738,13 @@ class Moderation(commands.Cog, name='moderation'):
         Example: $modlog @badperson spamming in channel
         """
         result = str()
-        # Searching in sqlite is case-insensitive
-        search = '%' + filter_ + '%'
-        c = self.con.execute("""SELECT moderator, user, timestamp, type, duration, reason 
-                                FROM modlog 
-                                WHERE guild_id = ?
-                                    AND user_id = ?
-                                    AND (type LIKE ? OR reason LIKE ?)
-                                ORDER BY timestamp DESC""",
-                            (ctx.guild.id, user.id, search, search))
-        for i in range(number):
-            r = c.fetchone()
-            if r is None:
-                break
-            punishment = r[3].capitalize()
-            if r[4] is not None and r[4] > 0:
-                punishment += f" for {r[4]} minutes"
-            result = f"[{r[2]}] ({r[0]}) {punishment} | {r[1]} - Reason: {r[5]}\n" + result
-        else:
-            i = number
-        
-        c.close()
+        cases = self.search_cases(ctx.guild.id, user.id, number, filter_)
+        for case in cases:
+            punishment = case.type.capitalize()
+            if case.duration is not None and case.duration > 0:
+                punishment += f" for {case.duration} minutes"
+            result = f"Case {case.case_id} [{case.timestamp}] ({case.moderator}) {punishment} | {case.user} - Reason: {case.reason}\n" + result
+        i = len(cases)
 
         # Format result
         addon = "1 log" if i == 1 else f"{i} logs"
@@ -517,6 +755,60 @@ class Moderation(commands.Cog, name='moderation'):
 
         await smart_send(ctx, result)
 
+    @commands.command()
+    @commands.has_guild_permissions(manage_guild=True)
+    async def case(self, ctx, case_id: PositiveInt):
+        """
+        Return the modlog entry with the given case number.
+
+        Usage: $case [case number]
+        Example: $case 42
+        """
+        case = self.get_case(ctx.guild.id, case_id)
+        if case is None:
+            raise ModerationError(f"There is no case {case_id} in this server.")
+        await ctx.send(embed=self.case_embed(case))
+
+    @commands.command()
+    @commands.has_guild_permissions(manage_guild=True)
+    async def reason(self, ctx, case_id: PositiveInt, *, reason: str):
+        """
+        Change the reason of a case. The case's message in the modlog channel
+        will be edited to show the new reason.
+
+        Usage: $reason [case number] [new reason]
+        Example: $reason 42 Spamming in multiple channels
+        """
+        if not self.set_case_reason(ctx.guild.id, case_id, reason):
+            raise ModerationError(f"There is no case {case_id} in this server.")
+        case = self.get_case(ctx.guild.id, case_id)
+        embed = self.case_embed(case)
+
+        # Edit the original modlog message directly using the stored IDs
+        channel = case.log_channel_id and self.bot.get_channel(case.log_channel_id)
+        if channel:
+            try:
+                message = await channel.fetch_message(case.log_message_id)
+                if message.embeds and message.embeds[0].thumbnail:
+                    embed.set_thumbnail(url=message.embeds[0].thumbnail.url)
+                await message.edit(embed=embed)
+            except discord.NotFound:
+                await ctx.send("The case's message in the modlog channel no longer exists.")
+            except discord.HTTPException:
+                await ctx.send("Unable to edit the case's message in the modlog channel.")
+        await ctx.send(embed=embed)
+
+
+def pack_archived(case: Case) -> bytes:
+    """Compress the fields of a case which are not stored as archive columns."""
+    return zlib.compress(json.dumps((case.moderator, case.moderator_id, case.user, case.type, case.duration,
+                                     case.reason, case.log_channel_id, case.log_message_id)).encode())
+
+def unpack_archived(case_id: int, user_id: int, timestamp: datetime, data: bytes) -> Case:
+    """Reconstruct a case from a row of the archive table."""
+    moderator, moderator_id, user, type_, duration, reason, log_channel_id, log_message_id = json.loads(zlib.decompress(data))
+    return Case(case_id, moderator, moderator_id, user, user_id, timestamp,
+                type_, duration, reason, log_channel_id, log_message_id)
 
 def setup(bot):
     bot.add_cog(Moderation(bot))
\ No newline at end of file
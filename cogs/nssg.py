@@ -2,17 +2,23 @@ from datetime import datetime, date
 from collections import defaultdict
 import json
 import asyncio
+import functools
 import logging
-from typing import Union
-from os.path import isfile
+from typing import Union, List, Tuple
 import logging
 
-import aiohttp
 import discord
 from discord.ext import commands, tasks
 
+from cogs.helper import PositiveInt
+
 NSSG_ID = 692230983650377731
 CHANNEL_ID = 729654637677903926
+# Number of members shown on each page of the ORD board
+ORDBOARD_PAGE_SIZE = 15
+# Number of expired enlistment messages edited at the same time
+EXPIRY_CONCURRENCY = 5
+CMPB_ENDPOINT = 'https://www.cmpb.gov.sg/web/wcm/connect/cmpb/cmpbContent/CMPBHome/before-ns/Enlistment-dates/enlistment-dates?srv=cmpnt&source=library&cmpntname=CMPBDesign/sections/page-2-BeforeNS/enlistment-dates/NAV%20Calendar%20Events%20Json'
 
 class Date(commands.Converter):
     """Convert the input into `datetime.date` if possible."""
@@ -26,6 +32,15 @@ class Date(commands.Converter):
         # raise commands.BadArgument("Unknown date format. A good example of a date format is 'DDMMYY', 'DD/MM/YY' or 'DD/MM/YYYY' such as '15/02/20'.")
 
 
+class Enlistment:
+    """Tracked state of an enlistment message, so that its embed can be rendered without fetching it."""
+    __slots__ = ('msg_id', 'embed', 'reactors')
+
+    def __init__(self, msg_id: int, num_choices: int, embed: dict=None):
+        self.msg_id = msg_id
+        self.embed = embed # dict => The message's embed, fetched when first needed if not known
+        self.reactors = [dict() for _ in range(num_choices)] # User IDs who reacted to each choice, in order of reacting
+
 class Nssg(commands.Cog, name='nssg'):
 
     def __init__(self, bot):
@@ -38,28 +53,60 @@ class Nssg(commands.Cog, name='nssg'):
         self.con.execute("""CREATE TABLE IF NOT EXISTS nssg (
                                 user_id INTEGER UNIQUE NOT NULL,
                                 ord DATE NOT NULL)""")
+        # The ORD board is a range scan over upcoming ORDs, in order
+        self.con.execute("CREATE INDEX IF NOT EXISTS nssg_ord_idx ON nssg(ord)")
+        self.con.execute("""CREATE TABLE IF NOT EXISTS orddigest (
+                                guild_id    INTEGER PRIMARY KEY NOT NULL,
+                                channel_id  INTEGER NOT NULL)""")
 
         self.con.execute("""CREATE TABLE IF NOT EXISTS enlistmentmsgs (
                             msg_id      INTEGER UNIQUE NOT NULL,
                             date        TEXT    UNIQUE NOT NULL,
                             num_choices INTEGER
         )""")
-
-        self.lastUpdatedJSON =  date(1, 1, 1)
-        self.enlistmentmsgpooling = set()
+        self.con.execute("""CREATE TABLE IF NOT EXISTS enlistmentreactors (
+                                msg_id      INTEGER NOT NULL REFERENCES enlistmentmsgs(msg_id) ON DELETE CASCADE,
+                                choice      INTEGER NOT NULL,
+                                user_id     INTEGER NOT NULL,
+                                PRIMARY KEY(msg_id, choice, user_id))""")
+        self.con.commit()
+
+        # Load the reactors of each enlistment message, so reactions never need the message to be fetched
+        self.enlistments = dict() # Message ID => Enlistment
+        for msg_id, num_choices in self.con.execute("SELECT msg_id, num_choices FROM enlistmentmsgs"):
+            self.enlistments[msg_id] = Enlistment(msg_id, num_choices)
+        for msg_id, choice, user_id in self.con.execute("SELECT msg_id, choice, user_id FROM enlistmentreactors ORDER BY rowid"):
+            enlistment = self.enlistments.get(msg_id)
+            if enlistment is not None and choice < len(enlistment.reactors):
+                enlistment.reactors[choice][user_id] = None
+        for msg_id in self.enlistments:
+            self.bot.reaction_registry.register(msg_id, self.on_enlistment_reaction)
+        # Message ID => (choice, user ID) of reactions received while the message is being reconciled
+        self.reconciling = dict()
+        self.reconcile_task = self.bot.loop.create_task(self.reconcileReactors())
+
+        self.calendar = None # List of (date, title) of every enlistment in the CMPB calendar, parsed when it changes
 
         now = datetime.now()
         seconds_to_midnight = 86400 - (now - now.replace(hour=0, minute=0, second=0)).total_seconds()
         logging.info(str(seconds_to_midnight) + " seconds to midnight.")
         # Update enlistment messages every 12am + 5 seconds
         self.task = self.bot.schedule_task(seconds_to_midnight + 5, self.enlistmentmessages.start)
+        # Post the ORD digests every 12am + 10 seconds
+        self.digest_task = self.bot.schedule_task(seconds_to_midnight + 10, self.orddigests.start)
 
         self.aprilFools = set()
 
     def cog_unload(self):
         if not self.task.cancelled():
             self.task.cancel()
+        self.reconcile_task.cancel()
+        for msg_id in self.enlistments:
+            self.bot.reaction_registry.unregister(msg_id)
         self.enlistmentmessages.cancel()
+        if not self.digest_task.cancelled():
+            self.digest_task.cancel()
+        self.orddigests.cancel()
     
     ################################################################################
     #                                  Commands                                    #
@@ -108,54 +155,97 @@ class Nssg(commands.Cog, name='nssg'):
             # Manual error handling for now
             return await ctx.send(embed=self.bot.error_embed("Unknown date format. A good date formats includes 'DDMMYY', 'DD/MM/YY' or 'DD/MM/YYYY'.\n Example: 15/02/20"))
 
-    ################################################################################
-    #                               Helper Functions                               #
-    ################################################################################
+    @commands.command()
+    @commands.guild_only()
+    async def ordboard(self, ctx: commands.Context, page: PositiveInt=1):
+        """
+        Return the members of this server who have yet to ORD, sorted by the
+        number of days to their ORD.
 
-    async def getEvents(self) -> dict:
+        Example: To see the second page of the board, use $ordboard 2
         """
-        Helper function used to obtain the enlistment dates from CMPB website, and store it as a json file
-        for personal reference.
+        board, pages = self.ordBoard(ctx.guild, page)
+        if not board:
+            if pages == 0:
+                return await ctx.send("Nobody in this server has an upcoming ORD.")
+            return await ctx.send(f"There are only {pages} page{'s' if pages > 1 else ''}.")
+        embed = discord.Embed(title=f"ORD Board of {ctx.guild}", description=board, colour=discord.Colour.green())
+        embed.set_footer(text=f"Page {page} of {pages}")
+        return await ctx.send(embed=embed)
 
-        This will check the CMPB website once every week to ensure that the json file is up to date. Else,
-        it'll import the json file and output it as appropriate.
+    @commands.command()
+    @commands.guild_only()
+    @commands.has_guild_permissions(manage_guild=True)
+    async def orddigest(self, ctx: commands.Context, channel: discord.TextChannel=None):
         """
+        Post the ORD board in the channel every day, or stop posting it if the
+        channel is not provided.
 
-        if (date.today() - self.lastUpdatedJSON).days >= 7 or not isfile('output.json'):
-                
-            # Last updated more than 7 days ago, check CMPB website again
-            endpoint = 'https://www.cmpb.gov.sg/web/wcm/connect/cmpb/cmpbContent/CMPBHome/before-ns/Enlistment-dates/enlistment-dates?srv=cmpnt&source=library&cmpntname=CMPBDesign/sections/page-2-BeforeNS/enlistment-dates/NAV%20Calendar%20Events%20Json'
+        Example: $orddigest #general
+        """
+        with self.con:
+            if channel is None:
+                self.con.execute("DELETE FROM orddigest WHERE guild_id = ?", (ctx.guild.id, ))
+                return await ctx.send("The daily ORD digest has been turned off.")
+            self.con.execute("""INSERT INTO orddigest(guild_id, channel_id) VALUES (?, ?)
+                                ON CONFLICT(guild_id) DO UPDATE SET channel_id=excluded.channel_id""",
+                             (ctx.guild.id, channel.id))
+        return await ctx.send(f"The ORD board will be posted in {channel.mention} every day.")
 
-            async with aiohttp.ClientSession() as session:
-                async with session.get(endpoint) as response:
-                    website_text = await response.read()
-                    data = json.loads(website_text)
+    ################################################################################
+    #                               Helper Functions                               #
+    ################################################################################
 
-            events = defaultdict(list)
-            today = date.today()
+    async def getEvents(self) -> dict:
+        """
+        Helper function used to obtain the enlistment dates from CMPB website, for the next 120 days.
 
-            # Format the received data
-            for event in data["calendarEventList"][1:]:
+        The calendar is requested with the bot's shared HTTP client, which only downloads it again if it
+        has changed. The parsed calendar is kept in memory, so it is only parsed again when it changes.
+        """
+        response = await self.bot.http_client.get(CMPB_ENDPOINT)
+        if response.modified or self.calendar is None:
+            self.calendar = self.parseCalendar(response.body)
 
-                # Skip if the event date is before current date and after 120 days
-                eventDate = datetime.strptime(event['startDate'], '%b %d, %Y').date()
-                if not (0 <= (eventDate - today).days <= 120):
-                    continue
-                
-                # Ensure category isn't a public holiday (ie is a BMT enlistment date)
-                category = event['categories'][event['categories'].rindex('/')+1:]
-                if category != 'Public Holiday':
-                    events[str(eventDate)].append(event['title'])
+        # Skip if the event date is before current date and after 120 days
+        events = defaultdict(list)
+        today = date.today()
+        for eventDate, title in self.calendar:
+            if 0 <= (eventDate - today).days <= 120:
+                events[str(eventDate)].append(title)
+        return events
 
-            # Output to a file
-            with open('output.json', 'w') as f:
-                f.write(json.dumps(events, indent=4))
+    @staticmethod
+    def parseCalendar(body: bytes) -> List[Tuple[date, str]]:
+        """Return the date and title of every BMT enlistment in the CMPB calendar."""
+        calendar = list()
+        for event in json.loads(body)["calendarEventList"][1:]:
+            # Ensure category isn't a public holiday (ie is a BMT enlistment date)
+            category = event['categories'][event['categories'].rindex('/')+1:]
+            if category != 'Public Holiday':
+                calendar.append((datetime.strptime(event['startDate'], '%b %d, %Y').date(), event['title']))
+        return calendar
+
+    def ordBoard(self, guild: discord.Guild, page: int) -> Tuple[str, int]:
+        """
+        Return the given page of the guild's ORD board, and the number of pages.
 
-            self.lastUpdatedJSON = date.today()
-        else:
-            with open('output.json', 'r') as f:
-                events = json.load(f)
-        return events
+        Upcoming ORDs of every user are read in order with one range scan over the `ord` index, and
+        kept if the user is in the guild's member cache.
+        """
+        today = date.today()
+        start = (page - 1) * ORDBOARD_PAGE_SIZE
+        lines = list()
+        count = 0
+        for user_id, ord_date in self.con.execute("SELECT user_id, ord FROM nssg WHERE ord >= ? ORDER BY ord", (today, )):
+            member = guild.get_member(user_id)
+            if member is None:
+                continue
+            if start <= count < start + ORDBOARD_PAGE_SIZE:
+                days = (ord_date - today).days
+                lines.append(f"{count + 1}. {member} - " + (f"{days} day{'s' if days > 1 else ''}" if days else "ORDLO!"))
+            count += 1
+        return '\n'.join(lines), -(-count // ORDBOARD_PAGE_SIZE)
 
     def createEmbed(self, date_: date, events) -> discord.Embed:
         embed = discord.Embed(title=f"Enlistment on {date_.strftime('%d %b %Y')}", colour=discord.Colour.green())
@@ -167,21 +257,37 @@ class Nssg(commands.Cog, name='nssg'):
     async def completeMessages(self):
         today = str(date.today())
         channel = await self.bot.fetch_channel(CHANNEL_ID)
-        for event in self.con.execute("SELECT * FROM enlistmentmsgs WHERE date < ?", (today, )):
-            try:
-                message = await channel.fetch_message(event[0])
-                embeddict = message.embeds[0].to_dict()
-                embeddict['color'] = discord.Colour.red().value
-                embeddict['footer']['text'] = "Stopped tracking."
-                await message.edit(embed=discord.Embed.from_dict(embeddict))
-            except discord.NotFound:
-                # Message was deleted, probably intentional, nvm, next day will repost
-                pass
-            except discord.DiscordException as e:
-                await channel.send(str(e))
-            finally:
-                self.con.execute("DELETE FROM enlistmentmsgs WHERE msg_id = ?", (event[0], ))
-                self.con.commit()
+        # Take a snapshot of the expired messages, so the connection is free while they are edited
+        expired = [msg_id for msg_id, in self.con.execute("SELECT msg_id FROM enlistmentmsgs WHERE date < ?", (today, ))]
+        if not expired:
+            return
+
+        semaphore = asyncio.Semaphore(EXPIRY_CONCURRENCY)
+        async def complete(msg_id: int):
+            async with semaphore:
+                # Render the final list of members without waiting for any pending edit
+                self.bot.embed_updater.cancel(msg_id)
+                enlistment = self.enlistments.pop(msg_id, None) or Enlistment(msg_id, 0)
+                self.bot.reaction_registry.unregister(msg_id)
+                try:
+                    embeddict = (await self.render_members(enlistment)).to_dict()
+                    embeddict['color'] = discord.Colour.red().value
+                    embeddict['footer']['text'] = "Stopped tracking."
+                    await channel.get_partial_message(msg_id).edit(embed=discord.Embed.from_dict(embeddict))
+                except discord.NotFound:
+                    # Message was deleted, probably intentional, nvm, next day will repost
+                    pass
+                except discord.DiscordException as e:
+                    await channel.send(str(e))
+
+        # An unexpected error editing one message should not stop the rest from being completed
+        results = await asyncio.gather(*(complete(msg_id) for msg_id in expired), return_exceptions=True)
+        for msg_id, result in zip(expired, results):
+            if isinstance(result, Exception):
+                logging.error(f"Unable to complete enlistment message {msg_id}. Error {result!r}")
+        with self.con:
+            self.con.execute(f"DELETE FROM enlistmentmsgs WHERE msg_id IN ({', '.join('?' * len(expired))})", expired)
+        logging.info(f"Completed {len(expired)} enlistment messages.")
 
     ################################################################################
     #                                 Main Functions                               #
@@ -204,7 +310,8 @@ class Nssg(commands.Cog, name='nssg'):
                 continue
             
             # Get embed and post it
-            message = await channel.send(embed=self.createEmbed(dateObject, events[eventDate]))
+            embed = self.createEmbed(dateObject, events[eventDate])
+            message = await channel.send(embed=embed)
             for i in range(len(events[eventDate])):
                 # Add reactions
                 await message.add_reaction(numbers[i])
@@ -213,52 +320,125 @@ class Nssg(commands.Cog, name='nssg'):
             self.con.execute("INSERT INTO enlistmentmsgs(msg_id, date, num_choices) VALUES (?, ?, ?)",
                                 (message.id, eventDate, len(events[eventDate])))
             self.con.commit()
+            self.enlistments[message.id] = Enlistment(message.id, len(events[eventDate]), embed.to_dict())
+            self.bot.reaction_registry.register(message.id, self.on_enlistment_reaction)
 
         # Clear expired events
         await self.completeMessages()
 
+    @tasks.loop(hours=24)
+    async def orddigests(self):
+        today = date.today()
+        for guild_id, channel_id in self.con.execute("SELECT guild_id, channel_id FROM orddigest").fetchall():
+            guild = self.bot.get_guild(guild_id)
+            channel = guild and guild.get_channel(channel_id)
+            if channel is None:
+                continue
+            board, pages = self.ordBoard(guild, 1)
+            if not board:
+                continue
+            embed = discord.Embed(title=f"ORD Board for {today.strftime('%d %b %Y')}", description=board, colour=discord.Colour.green())
+            if pages > 1:
+                embed.set_footer(text=f"Use {self.bot.get_guild_prefix(guild)}ordboard 2 to see more.")
+            try:
+                await channel.send(embed=embed)
+            except discord.HTTPException as e:
+                logging.error(f"Unable to post ORD digest in guild {guild_id}. Error {e}")
+
     ################################################################################
     #                                  Listeners                                   #
     ################################################################################
 
-    @commands.Cog.listener()
-    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
-        if payload.user_id != self.bot.user.id:
-            info = self.con.execute("SELECT * FROM enlistmentmsgs WHERE msg_id = ?", (payload.message_id, )).fetchone()
-            if info and emojis.get(payload.emoji.name, 100) <= info[2]:
-                return await self.update_members(payload, info[2])
-    
-    @commands.Cog.listener()
-    async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent):
-        if payload.user_id != self.bot.user.id:
-            info = self.con.execute("SELECT * FROM enlistmentmsgs WHERE msg_id = ?", (payload.message_id, )).fetchone()
-            if info and emojis.get(payload.emoji.name, 100) <= info[2]:
-                return await self.update_members(payload, info[2])
-    
-    async def update_members(self, payload: discord.RawReactionActionEvent, num: int) -> None:
-        # Pool the messages to reduce number of times needed to edit
-        if payload.message_id in self.enlistmentmsgpooling:
+    def on_enlistment_reaction(self, payload: discord.RawReactionActionEvent, added: bool) -> None:
+        # Called by the bot's reaction registry for reactions on enlistment messages only
+        enlistment = self.enlistments[payload.message_id]
+        if emojis.get(payload.emoji.name, 100) > len(enlistment.reactors):
             return
-        self.enlistmentmsgpooling.add(payload.message_id)
-        await asyncio.sleep(0.2)
-
-        # Need to get message instance again since reactions don't update
-        channel = self.bot.get_channel(payload.channel_id)
-        message = await channel.fetch_message(payload.message_id)
-        # Technically the above can result in None, but it shouldn't happen
-
-        embeddict = message.embeds[0].to_dict()
-        for i in range(num):
+        choice = emojis[payload.emoji.name] - 1
+        if payload.message_id in self.reconciling:
+            self.reconciling[payload.message_id].add((choice, payload.user_id))
+        with self.con:
+            if added:
+                enlistment.reactors[choice][payload.user_id] = None
+                self.con.execute("INSERT OR IGNORE INTO enlistmentreactors(msg_id, choice, user_id) VALUES (?, ?, ?)",
+                                 (payload.message_id, choice, payload.user_id))
+            else:
+                enlistment.reactors[choice].pop(payload.user_id, None)
+                self.con.execute("DELETE FROM enlistmentreactors WHERE msg_id = ? AND choice = ? AND user_id = ?",
+                                 (payload.message_id, choice, payload.user_id))
+        self.update_members(enlistment)
+    
+    def update_members(self, enlistment: Enlistment) -> None:
+        # Pool the edits to reduce number of times needed to edit
+        message = self.bot.get_channel(CHANNEL_ID).get_partial_message(enlistment.msg_id)
+        self.bot.embed_updater.request(message, functools.partial(self.render_members, enlistment), interval=1.0)
+
+    async def render_members(self, enlistment: Enlistment) -> discord.Embed:
+        # The embed is only fetched if it was not known, such as for messages posted before a restart
+        if enlistment.embed is None:
+            message = await self.bot.get_channel(CHANNEL_ID).fetch_message(enlistment.msg_id)
+            enlistment.embed = message.embeds[0].to_dict()
+
+        embeddict = enlistment.embed
+        for i, reactors in enumerate(enlistment.reactors):
             content = ""
-            async for user in message.reactions[i].users():
-                if user != self.bot.user:
-                    content += f"{user}\n"
-                    if len(content) > 1500:
-                        content = content[:-len(f"{user}\n")] + "..."
-                        break
+            for user_id in reactors:
+                user = self.bot.get_user(user_id) or user_id
+                if len(content) + len(f"{user}\n") > 1500:
+                    content += "..."
+                    break
+                content += f"{user}\n"
             embeddict['fields'][i]['value'] = content or "None"
-        self.enlistmentmsgpooling.remove(payload.message_id)
-        await message.edit(embed=discord.Embed.from_dict(embeddict))
+        return discord.Embed.from_dict(embeddict)
+
+    async def reconcileReactors(self):
+        """
+        Compare the stored reactors of each enlistment message against the
+        reactions on the message once on startup, to pick up any reactions
+        made while the bot was offline. Only the differences are applied, and
+        users who reacted while the reactions were being fetched are left as
+        the reaction events set them.
+        """
+        await self.bot.wait_until_ready()
+        channel = self.bot.get_channel(CHANNEL_ID)
+        if channel is None:
+            return
+        for enlistment in list(self.enlistments.values()):
+            self.reconciling[enlistment.msg_id] = touched = set()
+            try:
+                try:
+                    message = await channel.fetch_message(enlistment.msg_id)
+                except discord.HTTPException:
+                    continue # Dealt with when the message is completed
+                enlistment.embed = message.embeds[0].to_dict()
+
+                changed = False
+                for reaction in message.reactions:
+                    choice = emojis.get(reaction.emoji, 100) - 1
+                    if choice >= len(enlistment.reactors):
+                        continue
+                    actual = [user.id async for user in reaction.users() if user != self.bot.user]
+                    # No awaits from here on, so no reaction event can arrive while applying the differences
+                    stored = enlistment.reactors[choice]
+                    added = [user_id for user_id in actual if user_id not in stored and (choice, user_id) not in touched]
+                    removed = [user_id for user_id in stored if user_id not in actual and (choice, user_id) not in touched]
+                    if not added and not removed:
+                        continue
+                    changed = True
+                    for user_id in added:
+                        stored[user_id] = None
+                    for user_id in removed:
+                        del stored[user_id]
+                    with self.con:
+                        self.con.executemany("INSERT OR IGNORE INTO enlistmentreactors(msg_id, choice, user_id) VALUES (?, ?, ?)",
+                                             ((enlistment.msg_id, choice, user_id) for user_id in added))
+                        self.con.executemany("DELETE FROM enlistmentreactors WHERE msg_id = ? AND choice = ? AND user_id = ?",
+                                             ((enlistment.msg_id, choice, user_id) for user_id in removed))
+                if changed:
+                    self.update_members(enlistment)
+            finally:
+                del self.reconciling[enlistment.msg_id]
+        logging.info("Reconciled enlistment message reactors.")
         
 
 numbers = ['1️⃣', '2️⃣', '3️⃣', '4️⃣', '5️⃣', '6️⃣', '7️⃣', '8️⃣', '9️⃣', '🔟']
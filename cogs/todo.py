@@ -1,89 +1,188 @@
 import discord
-from discord.ext import commands, tasks as tk
+from discord.ext import commands
 import asyncio
-from datetime import date, timedelta, datetime
+from datetime import date, timedelta
+from os.path import isfile
+from os import replace
+import logging
 import pickle
+import typing
+import heapq
+from array import array
+
+# Suffix shown after completed tasks, which older versions stored as part of the task
+COMPLETED = " :white_check_mark:"
+
+class DailyScores:
+    """
+    Scores by day, stored as an array indexed by the day's ordinal along with
+    a Fenwick tree over the array, so that the total of any range of days is
+    found in O(log n). The arrays grow as days outside of them are added.
+    """
+    __slots__ = ('base', 'values', 'tree')
+
+    def __init__(self, days: typing.Dict[int, int]=None):
+        """`days` is an optional dictionary of day ordinals to scores to start with."""
+        days = days or dict()
+        self.base = min(days, default=date.today().toordinal())
+        self.values = array('q', bytes(8 * (max(days, default=self.base) - self.base + 1)))
+        for ordinal, score in days.items():
+            self.values[ordinal - self.base] += score
+        self._build()
+
+    def _build(self):
+        """Build the Fenwick tree from `values` in O(n)."""
+        size = len(self.values)
+        self.tree = array('q', [0]) + self.values
+        for i in range(1, size + 1):
+            parent = i + (i & -i)
+            if parent <= size:
+                self.tree[parent] += self.tree[i]
+
+    def _cover(self, ordinal: int):
+        """Grow the arrays so that they include the day."""
+        if ordinal < self.base:
+            # Leave room for more days before, as scores can be changed for any past day
+            shift = max(self.base - ordinal, len(self.values))
+            self.values = array('q', bytes(8 * shift)) + self.values
+            self.base -= shift
+        elif ordinal - self.base >= len(self.values):
+            self.values.extend(bytes(8 * max(ordinal - self.base + 1 - len(self.values), len(self.values))))
+        else:
+            return
+        self._build()
+
+    def add(self, ordinal: int, change: int):
+        self._cover(ordinal)
+        i = ordinal - self.base
+        self.values[i] += change
+        i += 1
+        while i < len(self.tree):
+            self.tree[i] += change
+            i += i & -i
+
+    def get(self, ordinal: int) -> int:
+        i = ordinal - self.base
+        return self.values[i] if 0 <= i < len(self.values) else 0
+
+    def _prefix(self, i: int) -> int:
+        """Return the total of the first `i` days in the arrays."""
+        i = min(i, len(self.values))
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def total(self, first: int, last: int) -> int:
+        """Return the total score from day ordinal `first` to `last`, inclusive."""
+        if last < first:
+            return 0
+        return self._prefix(last - self.base + 1) - self._prefix(first - self.base)
 
 class todo(commands.Cog):
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        # Try to initialise the storage and score system. Both `self.storage` and `self.score` are nested dictionaries.
-        # self.storage[server_id][user_id] = list of tasks
-        # self.score[server_id][user.id][date] = score of user for that day
-        # Before accessing any value, you need to check if the key contains a value or not
-        try:
-            with open('storage.pkl', 'rb') as f:
-                self.storage = pickle.load(f)
-            with open('score.pkl', 'rb') as f:
-                self.score = pickle.load(f)
-        except OSError as e:
-            print(e)
-            self.storage = dict()
-            self.score = dict()
-        self.regular_save.start()
-
-    def cog_unload(self):
-        # Special method that activates when the cog is unloaded
-        print("Unloading 'todo' cog: Saving todo list and scores")
-        self.save()
-        self.regular_save.cancel()
-
-    @tk.loop(minutes=30.0)
-    async def regular_save(self):
-        print(f"todo cog: Saving details at {datetime.now()}")
-        self.save()
-
-    def save(self):
-        with open('storage.pkl', 'wb') as f:
-            pickle.dump(self.storage, f, pickle.HIGHEST_PROTOCOL)
-        with open('score.pkl', 'wb') as f:
-            pickle.dump(self.score, f, pickle.HIGHEST_PROTOCOL)
-
-    def storage_helper(self, ctx, user_id=None):
-        """Helper function that ensures the `self.storage` nested dictionary is ready for lookup.
-        Takes in an optional input `user_id` to prepare the database for that user ID. Otherwise,
-        user_id is extracted from the context. It returns the `server_id` and`user_id` used."""
-        guild, author = (ctx.guild.id, ctx.author.id)
-        if user_id is not None:
-            author = user_id
-        
-        # Checks if guild is in the dictionary
-        if self.storage.get(guild) is None:
-            self.storage[guild] = {author: list()}
-        # Checks if the user is in the dictionary
-        elif self.storage[guild].get(author) is None:
-            self.storage[guild][author] = list()
-        return (guild, author)
-
-    def score_helper(self, ctx, user_id=None):
-        """Helper function that ensures the `self.score` nested dictionary is ready for lookup.
-        Takes in an optional input `user_id` to prepare the database for that user ID. Otherwise,
-        user_id is extracted from the context. It returns the `server_id`,`user_id` and `day` used."""
-        guild, author, day = (ctx.guild.id, ctx.author.id, date.today())
-        if user_id is not None:
-            author = user_id
-
-        # Checks if guild is in the dictionary
-        if self.score.get(guild) is None:
-            self.score[guild] = {author: {day: 0}}
-        # Checks if the user is in the dictionary
-        elif self.score[guild].get(author) is None:
-            self.score[guild][author] = {day: 0}
-        # Checks if the day is in the dictionary
-        elif self.score[guild][author].get(day) is None:
-            self.score[guild][author][day] = 0
-        return (guild, author, day)
-        
+        self.con = self.bot.con
+
+        # Every change is written to the database as it is made. Tasks are
+        # listed in the order they were added, which is the order of their IDs.
+        self.con.execute("""CREATE TABLE IF NOT EXISTS todoitems (
+                                id          INTEGER PRIMARY KEY,
+                                guild_id    INTEGER NOT NULL,
+                                user_id     INTEGER NOT NULL,
+                                item        TEXT NOT NULL,
+                                done        INTEGER NOT NULL DEFAULT 0)""")
+        self.con.execute("CREATE INDEX IF NOT EXISTS todoitems_user_idx ON todoitems(guild_id, user_id, id)")
+        self.con.execute("""CREATE TABLE IF NOT EXISTS todoscores (
+                                guild_id    INTEGER NOT NULL,
+                                user_id     INTEGER NOT NULL,
+                                day         DATE NOT NULL,
+                                score       INTEGER NOT NULL,
+                                PRIMARY KEY(guild_id, user_id, day))""")
+        self.con.commit()
+        self.import_pickle()
+
+        # Daily scores are indexed in memory for range queries, by user and
+        # for the whole guild. The database stays the source of truth.
+        self.user_scores = dict() # Guild ID => {user ID: DailyScores}
+        self.guild_scores = dict() # Guild ID => DailyScores of the guild's total
+        days = dict()
+        for guild_id, user_id, day, score in self.con.execute("SELECT guild_id, user_id, day, score FROM todoscores"):
+            days.setdefault((guild_id, user_id), dict())[day.toordinal()] = score
+        for key, user_days in days.items():
+            self.user_scores.setdefault(key[0], dict())[key[1]] = DailyScores(user_days)
+            guild_days = self.guild_scores.setdefault(key[0], dict())
+            for ordinal, score in user_days.items():
+                guild_days[ordinal] = guild_days.get(ordinal, 0) + score
+        self.guild_scores = {guild_id: DailyScores(guild_days) for guild_id, guild_days in self.guild_scores.items()}
+
+    def import_pickle(self):
+        """
+        One-time import of the todo lists and scores from the pickle files
+        used by older versions. The files are renamed once imported.
+        """
+        if not (isfile('storage.pkl') and isfile('score.pkl')):
+            return
+        logging.info("Importing todo lists and scores from pickle files.")
+        with open('storage.pkl', 'rb') as f:
+            storage = pickle.load(f)
+        with open('score.pkl', 'rb') as f:
+            score = pickle.load(f)
+        with self.con:
+            for guild_id, users in storage.items():
+                for user_id, items in users.items():
+                    self.con.executemany("INSERT INTO todoitems(guild_id, user_id, item, done) VALUES (?, ?, ?, ?)",
+                                         ((guild_id, user_id, item[:-len(COMPLETED)], 1) if item.endswith(COMPLETED)
+                                          else (guild_id, user_id, item, 0) for item in items))
+            for guild_id, users in score.items():
+                for user_id, days in users.items():
+                    self.con.executemany("""INSERT INTO todoscores(guild_id, user_id, day, score) VALUES (?, ?, ?, ?)
+                                            ON CONFLICT(guild_id, user_id, day) DO UPDATE SET score = score + excluded.score""",
+                                         ((guild_id, user_id, day, points) for day, points in days.items() if points))
+        replace('storage.pkl', 'storage.pkl.imported')
+        replace('score.pkl', 'score.pkl.imported')
+        logging.info("Imported todo lists and scores from pickle files.")
+
+    def get_items(self, guild_id: int, user_id: int) -> typing.List[typing.Tuple[int, str, int]]:
+        """Return the (ID, task, done) rows of the user's todo list, in order."""
+        return self.con.execute("SELECT id, item, done FROM todoitems WHERE guild_id = ? AND user_id = ? ORDER BY id",
+                                (guild_id, user_id)).fetchall()
+
+    def add_score(self, guild_id: int, user_id: int, day: date, change: int) -> int:
+        """Add `change` to the user's score for the day, and return the new score."""
+        if change == 0:
+            return self.get_score(guild_id, user_id, day)
+        with self.con:
+            self.con.execute("""INSERT INTO todoscores(guild_id, user_id, day, score) VALUES (?, ?, ?, ?)
+                                ON CONFLICT(guild_id, user_id, day) DO UPDATE SET score = score + excluded.score""",
+                             (guild_id, user_id, day, change))
+        ordinal = day.toordinal()
+        self.user_scores.setdefault(guild_id, dict()).setdefault(user_id, DailyScores()).add(ordinal, change)
+        self.guild_scores.setdefault(guild_id, DailyScores()).add(ordinal, change)
+        return self.get_score(guild_id, user_id, day)
+
+    def get_score(self, guild_id: int, user_id: int, day: date) -> int:
+        scores = self.user_scores.get(guild_id, {}).get(user_id)
+        return scores.get(day.toordinal()) if scores is not None else 0
+
+    def top_scores(self, guild_id: int, first: date, last: date, num: int) -> typing.List[typing.Tuple[int, int]]:
+        """Return the top `num` (user ID, total score) pairs in the guild between two days, inclusive."""
+        first, last = first.toordinal(), last.toordinal()
+        totals = ((user_id, scores.total(first, last)) for user_id, scores in self.user_scores.get(guild_id, {}).items())
+        return heapq.nlargest(num, totals, key=lambda x: x[1])
+
     def view_todo_list(self, ctx, server_id, user_id):
         """Helper function for `self.todo()` and `self.view()` which returns 
         what the user represented by `user_id` has in their todo list."""
-        if len(self.storage[server_id][user_id]) == 0:
+        items = self.get_items(server_id, user_id)
+        if len(items) == 0:
             return f"User {self.bot.get_user(user_id)} does not have anything in their todo list."
         else:
             result = f"{self.bot.get_user(user_id)} has the following to do list:\n"
-            for n, item in enumerate(self.storage[server_id][user_id]):
-                result += f"{n+1:2}: {item}\n"
+            for n, (_, item, done) in enumerate(items):
+                result += f"{n+1:2}: {item}{COMPLETED if done else ''}\n"
             return result
 
     @commands.command()
@@ -93,12 +192,12 @@ class todo(commands.Cog):
         Example: $todo - English essay
         - Science chapter 3
         - Mathematics exercise 6"""
-        # Obtain necessary infomation to input into self.storage nested dictionary
-        server_id, user_id = self.storage_helper(ctx)
-        for row in todolist.lstrip().splitlines():
-            if row.startswith("-"):
-                # If the person already has a todo list, add on the todo list.
-                self.storage[server_id][user_id].append(row[1:].strip())
+        server_id, user_id = ctx.guild.id, ctx.author.id
+        with self.con:
+            # If the person already has a todo list, add on the todo list.
+            self.con.executemany("INSERT INTO todoitems(guild_id, user_id, item) VALUES (?, ?, ?)",
+                                 ((server_id, user_id, row[1:].strip()) for row in todolist.lstrip().splitlines()
+                                  if row.startswith("-")))
         await ctx.send(self.view_todo_list(ctx, server_id, user_id))
     
     @commands.command(name='list', aliases=['view'])
@@ -111,8 +210,7 @@ class todo(commands.Cog):
             user_id = ctx.author.id
         else:
             user_id = user[0].id
-        server_id, _ = self.storage_helper(ctx, user_id)
-        await ctx.send(self.view_todo_list(ctx, server_id, user_id))
+        await ctx.send(self.view_todo_list(ctx, ctx.guild.id, user_id))
 
     @commands.command()
     async def complete(self, ctx, *completed_tasks):
@@ -124,11 +222,12 @@ class todo(commands.Cog):
         if len(completed_tasks) == 0:
             return await ctx.send("No input detected.")
 
-        # Set up variables and ensure databases are setup
-        _, _ = self.storage_helper(ctx)
-        server_id, user_id, day = self.score_helper(ctx)
-        l = len(self.storage[server_id][user_id])
+        # Set up variables
+        server_id, user_id, day = ctx.guild.id, ctx.author.id, date.today()
+        items = self.get_items(server_id, user_id)
+        l = len(items)
         result = str()
+        completed = list()
 
         # Check for valid input
         if l == 0:
@@ -143,25 +242,28 @@ class todo(commands.Cog):
                 continue
 
             # Check if task is already completed
-            if self.storage[server_id][user_id][n].endswith(" :white_check_mark:"):
+            item_id, item, done = items[n]
+            if done or item_id in completed:
                 result += f"Task {task} is already completed\n"
             else:
                 # Marks the task as completed with a checkmark
-                result += f"Completed task {task}: {self.storage[server_id][user_id][n]}\n"
-                self.storage[server_id][user_id][n] += " :white_check_mark:"
-                self.score[server_id][user_id][day] += 1
+                result += f"Completed task {task}: {item}\n"
+                completed.append(item_id)
 
-        await ctx.send(result + f"Your current score for today is {self.score[server_id][user_id][day]}.")
+        with self.con:
+            self.con.executemany("UPDATE todoitems SET done = 1 WHERE id = ?", ((item_id,) for item_id in completed))
+        score = self.add_score(server_id, user_id, day, len(completed))
+        await ctx.send(result + f"Your current score for today is {score}.")
     
     @commands.command()
     async def cleartodo(self, ctx):
         """Clears the entire todo list of the user.
 
         Example: $clear"""
-        server_id, user_id = self.storage_helper(ctx)
+        server_id, user_id = ctx.guild.id, ctx.author.id
 
         # Checks if user has a todo list 
-        if len(self.storage[server_id][user_id]) == 0:
+        if len(self.get_items(server_id, user_id)) == 0:
             return await ctx.send("You have no existing todo list.")
         
         # If user has an existing todo list, confirm that the user wants to clear their list.
@@ -175,7 +277,8 @@ class todo(commands.Cog):
             return await ctx.send("No proper response detected. Clear request rejected.")
         
         if response.content.upper() == 'Y':
-            self.storage[server_id][user_id] = list()
+            with self.con:
+                self.con.execute("DELETE FROM todoitems WHERE guild_id = ? AND user_id = ?", (server_id, user_id))
             return await ctx.send("Cleared todo list.")
         else:
             return await ctx.send("Clear request cancelled.")
@@ -190,8 +293,9 @@ class todo(commands.Cog):
             return await ctx.send("No input detected.")
 
         # Checks if user has a todo list 
-        server_id, user_id = self.storage_helper(ctx)
-        l = len(self.storage[server_id][user_id])
+        server_id, user_id = ctx.guild.id, ctx.author.id
+        items = self.get_items(server_id, user_id)
+        l = len(items)
         if l == 0:
             return await ctx.send("You have no existing todo list.")
 
@@ -209,7 +313,7 @@ class todo(commands.Cog):
                 failure += f"Invalid task number {task}\n"
                 continue
             if n not in to_delete:
-                confirmation += f"{n+1}: {self.storage[server_id][user_id][n]}\n"
+                confirmation += f"{n+1}: {items[n][1]}{COMPLETED if items[n][2] else ''}\n"
                 to_delete.append(n)
         
         if len(to_delete) == 0:
@@ -226,9 +330,8 @@ class todo(commands.Cog):
             return await ctx.send("No proper response detected. Remove request rejected.")
 
         if response.content.upper() == 'Y':
-            # Sort in reverse order so index remains the same
-            for index in sorted(to_delete, reverse=True):
-                self.storage[server_id][user_id].pop(index)
+            with self.con:
+                self.con.executemany("DELETE FROM todoitems WHERE id = ?", ((items[index][0],) for index in to_delete))
             await ctx.send("Removed requested tasks.")
             await ctx.send(self.view_todo_list(ctx, server_id, user_id))
         else:
@@ -237,9 +340,8 @@ class todo(commands.Cog):
     def view_score(self, ctx, num_days: int, user_id: int):
         """Helper function to return the score of a user `num_days` ago.
         Takes in a `discord.User` argument."""
-        server_id, user_id, _ = self.score_helper(ctx, user_id)
         day = date.today() - timedelta(days=float(num_days))
-        return self.score[server_id][user_id].get(day, 0)
+        return self.get_score(ctx.guild.id, user_id, day)
 
     @commands.command(name='score')
     async def _score(self, ctx, num_days: int = 0, user: discord.User = None):
@@ -272,22 +374,13 @@ class todo(commands.Cog):
         
         Example: $highscore 3"""
         today = date.today()
-        server_id = ctx.guild.id
-        highscore = list()
-        if self.score.get(server_id) is None:
-            self.score[server_id] = dict()
-        for user_id in self.score[server_id]:
-            sum = 0
-            for i in range(num_days + 1):
-                day = today - timedelta(days=i)
-                sum += self.score[server_id][user_id].get(day, 0)
-            highscore.append((user_id, sum))
+        start = today - timedelta(days=num_days)
+        highscore = self.top_scores(ctx.guild.id, start, today, 5)
         l = len(highscore)
 
         if l == 0:
             return await ctx.send("No scored recorded.")
-        highscore.sort(key=lambda x:x[1], reverse=True)
-        
+
         if num_days > 0:
             result = f"In the past {num_days} days, the highest {min(l, 5)} scores are:\n"
         else:
@@ -298,24 +391,26 @@ class todo(commands.Cog):
                     result = f"No one in this server has a score yet for today."
                 break
             result += f"{i}: {self.bot.get_user(highscore[i-1][0])} with {highscore[i-1][1]} points\n"
+        if highscore[0][1] != 0:
+            server_total = self.guild_scores[ctx.guild.id].total(start.toordinal(), today.toordinal())
+            result += f"This server has completed {server_total} tasks in total."
         await ctx.send(result)
 
     @commands.command()
     @commands.is_owner()
     async def check_files(self, ctx):
         """Owner-only command for debugging purposes."""
-        print(self.storage)
-        print(self.score)
+        print(self.con.execute("SELECT COUNT(*) FROM todoitems").fetchone()[0], "todo items")
+        print(self.con.execute("SELECT COUNT(*) FROM todoscores").fetchone()[0], "daily scores")
     
     @commands.command()
     @commands.has_permissions(manage_guild=True)
     async def change_score(self, ctx, num: int, user: discord.User, days_ago: int = 0):
         if days_ago < 0:
             return await ctx.send("Number of days ago should be non-negative.")
-        server_id, user_id, today = self.score_helper(ctx, user.id)
-        day = today - timedelta(days=days_ago)
-        self.score[server_id][user_id][day] = self.score[server_id][user_id].get(day, 0) + num
-        return await ctx.send(f"{user}'s score on {day} is now {self.score[server_id][user_id][day]}.")
+        day = date.today() - timedelta(days=days_ago)
+        score = self.add_score(ctx.guild.id, user.id, day, num)
+        return await ctx.send(f"{user}'s score on {day} is now {score}.")
 
 def setup(bot):
     bot.add_cog(todo(bot))
\ No newline at end of file
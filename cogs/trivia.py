@@ -0,0 +1,142 @@
+"""
+Trivia question bank used by the games cog.
+
+Questions are kept in their own SQLite database, as the bank can hold tens of
+thousands of questions. Each (category, difficulty) pair is a bucket, and
+every question has a dense position `bucket_pos` within its bucket. With the
+size of each bucket kept in memory, a random question is picked by choosing a
+random position and looking it up by index, without scanning the table or
+loading the questions into memory.
+
+Answers are stored alongside their normalised form, so checking a guess only
+needs the guess to be normalised.
+"""
+import sqlite3
+import unicodedata
+import random
+import re
+import typing
+from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple
+
+Question = namedtuple('Question', ('id', 'category', 'difficulty', 'question', 'answer', 'normalised'))
+
+DIFFICULTIES = ('easy', 'medium', 'hard')
+
+# Answers at least this long may be off by one letter and still be accepted
+FUZZY_MIN_LENGTH = 5
+
+_ARTICLES = re.compile(r'^(the|a|an) ')
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+
+def normalise(text: str) -> str:
+    """Lowercase `text`, strip accents, punctuation and a leading article, and collapse whitespace."""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = _NON_ALNUM.sub(' ', text).strip()
+    return _ARTICLES.sub('', text)
+
+def within_one_edit(a: str, b: str) -> bool:
+    """Return whether `a` and `b` differ by at most one insertion, deletion or substitution."""
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return a[i+1:] == b[i+1:]
+    return a[i:] == b[i+1:]
+
+def is_correct(guess: str, answer: str) -> bool:
+    """Check a normalised guess against a normalised answer."""
+    if guess == answer:
+        return True
+    return len(answer) >= FUZZY_MIN_LENGTH and within_one_edit(guess, answer)
+
+
+class QuestionBank:
+    """
+    Trivia questions stored in an SQLite database. All queries run on a single
+    worker thread, so that the event loop is not blocked and the connection is
+    never used by two threads at once.
+    """
+    def __init__(self, path: str):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.con = sqlite3.connect(path, check_same_thread=False)
+        self.con.execute("""CREATE TABLE IF NOT EXISTS questions (
+                                id          INTEGER PRIMARY KEY,
+                                category    TEXT NOT NULL,
+                                difficulty  TEXT NOT NULL,
+                                bucket_pos  INTEGER NOT NULL,
+                                question    TEXT NOT NULL,
+                                answer      TEXT NOT NULL,
+                                normalised  TEXT NOT NULL)""")
+        self.con.execute("CREATE UNIQUE INDEX IF NOT EXISTS questions_bucket_idx ON questions(category, difficulty, bucket_pos)")
+        self.con.commit()
+
+        # (category, difficulty) => Number of questions in that bucket
+        self.counts = {(category, difficulty): count for category, difficulty, count in
+                       self.con.execute("SELECT category, difficulty, COUNT(*) FROM questions GROUP BY category, difficulty")}
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.con.close()
+
+    def categories(self) -> typing.Dict[str, int]:
+        """Return the number of questions in each category."""
+        result = dict()
+        for (category, _), count in self.counts.items():
+            result[category] = result.get(category, 0) + count
+        return result
+
+    def count(self, category: str=None, difficulty: str=None) -> int:
+        return sum(count for (c, d), count in self.counts.items()
+                   if (category is None or c == category) and (difficulty is None or d == difficulty))
+
+    def sample(self, category: str=None, difficulty: str=None, exclude: typing.Container[int]=()) -> typing.Optional[Question]:
+        """
+        Return a random question, from the given category and difficulty if
+        provided. Questions with IDs in `exclude` are avoided where possible.
+        Returns `None` if there is no matching question.
+        """
+        buckets = [(key, count) for key, count in self.counts.items()
+                   if (category is None or key[0] == category) and (difficulty is None or key[1] == difficulty)]
+        if not buckets:
+            return None
+
+        # Weighting the buckets by size makes every matching question equally likely
+        question = None
+        for _ in range(5):
+            (c, d), count = random.choices(buckets, weights=[count for _, count in buckets])[0]
+            row = self.con.execute("""SELECT id, category, difficulty, question, answer, normalised FROM questions
+                                      WHERE category = ? AND difficulty = ? AND bucket_pos = ?""",
+                                   (c, d, random.randrange(count))).fetchone()
+            question = Question(*row)
+            if question.id not in exclude:
+                break
+        return question
+
+    def add_questions(self, rows: typing.Iterable[typing.Tuple[str, str, str, str]]) -> int:
+        """
+        Add (category, difficulty, question, answer) rows to the bank in a
+        single transaction, and return the number of questions added.
+        """
+        counts = dict(self.counts)
+        def positioned():
+            for category, difficulty, question, answer in rows:
+                key = (category, difficulty)
+                position = counts.get(key, 0)
+                counts[key] = position + 1
+                yield category, difficulty, position, question, answer, normalise(answer)
+
+        with self.con:
+            added = self.con.executemany("""INSERT INTO questions(category, difficulty, bucket_pos, question, answer, normalised)
+                                            VALUES (?, ?, ?, ?, ?, ?)""", positioned()).rowcount
+        self.counts = counts
+        return added
+
+    async def run(self, loop, func, *args):
+        """Run one of the bank's methods on its worker thread."""
+        return await loop.run_in_executor(self.executor, func, *args)
@@ -1,9 +1,12 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 import logging
 import asyncio
+import re
+import shlex
+import typing
 from datetime import datetime, timezone, timedelta
-from cogs.helper import smart_send, Duration # Cog loading is based on where bot.py is
+from cogs.helper import smart_send, Duration, addColumn # Cog loading is based on where bot.py is
 
 # I could have added a guild-specific timezones, but since I do not intend for
 # this bot to be used by non-Singaporean guilds, I will not over-engineer it.
@@ -11,51 +14,263 @@ from cogs.helper import smart_send, Duration # Cog loading is based on where bot
 # This is used as SQLite3 library spits out naive datetime instances, see below.
 TIMEZONE = 8
 
+# Number of mentions sent in each reminder message, and seconds between the messages
+MENTION_CHUNK = 50
+MENTION_INTERVAL = 1.0
+
+# Only reminders ending within this time are scheduled. The rest are picked up
+# by the sweep, which runs more often than the horizon.
+REMINDER_HORIZON = timedelta(hours=2)
+SWEEP_MINUTES = 30
+
+# Messages younger than this can be bulk deleted, with a margin for the time taken to delete them
+BULK_DELETE_AGE = timedelta(days=14, minutes=-5)
+# Number of messages deleted in each bulk delete, which is the most Discord allows
+BULK_DELETE_SIZE = 100
+# Seconds between deleting each message too old to be bulk deleted
+SINGLE_DELETE_INTERVAL = 1.0
+# Most messages looked through by one clearchat, so a filter that rarely matches still ends
+CLEARCHAT_SCAN_LIMIT = 10000
+
+# Replies accepted when confirming a clearchat
+CONFIRM_RESPONSES = {'y': True, 'yes': True, 'n': False, 'no': False}
+
+# Columns of a reminder row, in order
+REMINDER_COLUMNS = "guild_id, channel_id, message_id, end, text, author_id, tracked, rule"
+
+def db_timestamp(when: datetime) -> str:
+    """
+    Format the datetime for the reminders table. Microseconds are always
+    included, as SQLite3's timestamp converter cannot read a timezone without them.
+    """
+    return when.isoformat(' ', 'microseconds')
+
+DAY_NAMES = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+# Shortest interval a repeating reminder may use, in minutes
+MIN_REPEAT_MINUTES = 15
+
+# Recurring reminders store a rule instead of materialising every occurrence.
+# Rules are 'interval [minutes]', 'daily [HH:MM]' or 'weekly [days] [HH:MM]',
+# where days are comma separated weekday numbers with Monday as 0.
+def next_occurrence(rule: str, previous: datetime, now: datetime) -> datetime:
+    """Return the first occurrence of the rule after `now`, skipping any missed since `previous`."""
+    kind, *args = rule.split()
+    if kind == 'interval':
+        step = timedelta(minutes=int(args[0]))
+        return previous + step * ((now - previous) // step + 1)
+    hour, minute = map(int, args[-1].split(':'))
+    days = range(7) if kind == 'daily' else {int(day) for day in args[0].split(',')}
+    candidate = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    for offset in range(8):
+        occurrence = candidate + timedelta(days=offset)
+        if occurrence > now and occurrence.weekday() in days:
+            return occurrence
+    raise ValueError(f"Rule {rule} never occurs.")
+
+def describe_rule(rule: str) -> str:
+    kind, *args = rule.split()
+    if kind == 'interval':
+        return f"every {args[0]} minutes"
+    if kind == 'daily':
+        return f"daily at {args[0]}"
+    return f"every {', '.join(DAY_NAMES[int(day)].capitalize() for day in args[0].split(','))} at {args[1]}"
+
+class PurgeFilter:
+    """
+    Which messages `clearchat` deletes, parsed from filters such as
+    `from:@user`, `match:regex`, `bots`, `files`, `since:3d` and `until:2h`.
+    """
+    def __init__(self):
+        self.authors = set()
+        self.pattern = None
+        self.bots = False
+        self.files = False
+        self.since = None # datetime => Only delete messages sent after this time
+        self.until = None # datetime => Only delete messages sent before this time
+        self.description = list()
+
+    @classmethod
+    async def parse(cls, ctx: commands.Context, text: str) -> 'PurgeFilter':
+        self = cls()
+        try:
+            tokens = shlex.split(text)
+        except ValueError:
+            raise commands.BadArgument("Filters have an unclosed quotation mark.")
+        for token in tokens:
+            key, _, value = token.partition(':')
+            key = key.lower()
+            if key == 'bots':
+                self.bots = True
+                self.description.append("sent by bots")
+            elif key == 'files':
+                self.files = True
+                self.description.append("with attachments")
+            elif key == 'from' and value:
+                member = await commands.MemberConverter().convert(ctx, value)
+                self.authors.add(member.id)
+                self.description.append(f"from {member}")
+            elif key == 'match' and value:
+                try:
+                    self.pattern = re.compile(value, re.IGNORECASE)
+                except re.error as e:
+                    raise commands.BadArgument(f"Invalid regex: {e}")
+                self.description.append(f"matching `{value}`")
+            elif key in ('since', 'until') and value:
+                when = datetime.utcnow() - timedelta(minutes=await Duration().convert(ctx, value))
+                setattr(self, key, when)
+                self.description.append(f"{'sent within' if key == 'since' else 'older than'} {value}")
+            else:
+                raise commands.BadArgument(f"Unknown filter `{token}`. Use from:@user, match:regex, bots, files, since:[duration] or until:[duration].")
+        return self
+
+    def __call__(self, message: discord.Message) -> bool:
+        return ((not self.authors or message.author.id in self.authors)
+                and (not self.bots or message.author.bot)
+                and (not self.files or bool(message.attachments))
+                and (self.pattern is None or self.pattern.search(message.content) is not None))
+
+    def __str__(self):
+        return ', '.join(self.description)
+
 class Utility(commands.Cog, name='utilities'):
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.con = bot.con
         self.loop = asyncio.get_event_loop()
-        self.tasks = set()
+        self.tasks = dict() # Message ID => Task which ends the reminder, for reminders within the horizon
+        self.tracked = set() # Message IDs of reminders whose subscribers are recorded
+        self.confirmations = dict() # (Channel ID, author ID) => Future of the reply to a confirmation
         self.con.execute("""CREATE TABLE IF NOT EXISTS reminders (
                                 guild_id    INTEGER NOT NULL,
                                 channel_id  INTEGER NOT NULL,
                                 message_id  INTEGER UNIQUE NOT NULL,
                                 end         TIMESTAMP NOT NULL,
                                 text        TEXT NOT NULL)""")
-        for row in self.con.execute("SELECT * FROM reminders"):
-            # SQLite3 datetime comes out timezone naive, so need to change the timezone 
-            delta = (row[3].replace(tzinfo=timezone(timedelta(hours=TIMEZONE))) - datetime.now(timezone(timedelta(hours=TIMEZONE)))).total_seconds()
-            self.tasks.add(self.bot.schedule_task(delta, self.end_reminder(row)))
-            logging.info("Scheduled a reminder task.")
+        # Reminders made by older versions have no author, and their subscribers were never tracked
+        addColumn(self.con, 'reminders', 'author_id INTEGER')
+        addColumn(self.con, 'reminders', 'tracked INTEGER NOT NULL DEFAULT 0')
+        # Rule of a recurring reminder, which is NULL for one-off reminders
+        addColumn(self.con, 'reminders', 'rule TEXT')
+        # Users who reacted 🤚 to a reminder, recorded as they react
+        self.con.execute("""CREATE TABLE IF NOT EXISTS remindersubs (
+                                message_id  INTEGER NOT NULL REFERENCES reminders(message_id) ON DELETE CASCADE,
+                                user_id     INTEGER NOT NULL,
+                                PRIMARY KEY(message_id, user_id))""")
+        self.con.execute("CREATE INDEX IF NOT EXISTS remindersubs_user_idx ON remindersubs(user_id)")
+        self.con.execute("CREATE INDEX IF NOT EXISTS reminders_end_idx ON reminders(end)")
+        self.con.commit()
+
+        # Reactions can be made to any pending reminder, so every tracked reminder is registered
+        for message_id, in self.con.execute("SELECT message_id FROM reminders WHERE tracked = 1"):
+            self.track_reminder(message_id)
+        self.load_reminders()
+        self.sweep_reminders.start()
         
     def cog_unload(self):
-        for task in self.tasks:
+        self.sweep_reminders.cancel()
+        for task in self.tasks.values():
             task.cancel()
+        for message_id in self.tracked:
+            self.bot.reaction_registry.unregister(message_id)
+        for waiter in self.confirmations.values():
+            waiter.cancel()
+
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        # Route replies to the confirmation waiting for them, if there is one
+        waiter = self.confirmations.get((message.channel.id, message.author.id))
+        if waiter is not None and not waiter.done() and message.content.lower() in CONFIRM_RESPONSES:
+            waiter.set_result(message)
+
+    async def wait_for_confirmation(self, ctx: commands.Context, timeout: float=10.0) -> typing.Optional[discord.Message]:
+        """
+        Wait for the author to reply Y or N in the channel, and return the reply.
+        Returns `None` if there was no reply in time.
+        """
+        key = (ctx.channel.id, ctx.author.id)
+        self.confirmations[key] = self.loop.create_future()
+        try:
+            return await asyncio.wait_for(self.confirmations[key], timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            del self.confirmations[key]
 
     @commands.command()
     @commands.has_permissions(manage_messages=True)
-    async def clearchat(self, ctx: commands.Context, num: int):
+    @commands.bot_has_permissions(manage_messages=True, read_message_history=True)
+    async def clearchat(self, ctx: commands.Context, num: int, *, filters: str=''):
         """Clears a specified number of messages in the current chatroom.
-        Usage: $clearchat [num]"""
+        Filters can be added to only clear some messages:
+        from:@user - Messages sent by the user. Can be used more than once.
+        match:regex - Messages whose content matches the regex. Use quotes for spaces.
+        bots - Messages sent by bots.
+        files - Messages with attachments.
+        since:[duration] / until:[duration] - Messages sent within / before the duration, eg 3d.
+        Usage: $clearchat [num] [filters]
+        Example: $clearchat 50 from:@person "match:free nitro" since:2h"""
         if num < 1:
             return await ctx.send("Please input a positive integer.")
+        check = await PurgeFilter.parse(ctx, filters)
+        matching = f" {check}" if filters else ""
 
         # Double confirm clearing of messages
-        def correct_response(message):
-            return message.author == ctx.author and message.content.upper() in ('Y','N')
+        if (ctx.channel.id, ctx.author.id) in self.confirmations:
+            return await ctx.send("You already have a clear request waiting for confirmation in this channel.")
+        progress = await ctx.send(f"Are you sure you want to clear {num} messages{matching}? (Y/N)")
+        reply = await self.wait_for_confirmation(ctx)
+        if reply is None:
+            return await progress.edit(content="No proper response detected. Clear request rejected.")
+        if not CONFIRM_RESPONSES[reply.content.lower()]:
+            return await progress.edit(content="Clear request cancelled.")
 
-        try:
-            await ctx.send(f"Are you sure you want to clear {num} messages? (Y/N)")
-            response = await self.bot.wait_for('message', check=correct_response, timeout=10.0)
-        except asyncio.TimeoutError:
-            return await ctx.send("No proper response detected. Clear request rejected.")
+        def render():
+            return discord.Embed(title="Clearing Messages",
+                                 description=f"Deleted {deleted} of up to {num} messages{matching}.\nLooked through {scanned} messages.",
+                                 colour=discord.Colour.orange())
+        deleted = scanned = 0
+        await progress.edit(content=None, embed=render())
 
-        if response.content.upper() == 'Y':
-            return await ctx.channel.purge(limit=num + 3)
-        else:
-            return await ctx.send("Clear request cancelled.")
+        # Stream the history newest first, deleting messages in bulk while they are young enough.
+        # The command and the reply to the confirmation are deleted along with the first batch.
+        bulk_cutoff = discord.utils.time_snowflake(datetime.utcnow() - BULK_DELETE_AGE)
+        batch = [ctx.message, reply]
+        before = ctx.message if check.until is None else check.until
+        async for message in ctx.channel.history(limit=CLEARCHAT_SCAN_LIMIT, before=before):
+            if check.since is not None and message.created_at < check.since:
+                break # Every message after this one is older still
+            scanned += 1
+            if not check(message):
+                continue
+
+            if message.id > bulk_cutoff:
+                batch.append(message)
+                if len(batch) == BULK_DELETE_SIZE:
+                    await ctx.channel.delete_messages(batch)
+                    batch = list()
+            else:
+                # Too old to be bulk deleted, so delete it on its own at a slower pace
+                if batch:
+                    await ctx.channel.delete_messages(batch)
+                    batch = list()
+                try:
+                    await message.delete()
+                except discord.NotFound:
+                    pass
+                await asyncio.sleep(SINGLE_DELETE_INTERVAL)
+            deleted += 1
+            self.bot.embed_updater.request(progress, render)
+            if deleted == num:
+                break
+        if batch:
+            await ctx.channel.delete_messages(batch)
+
+        self.bot.embed_updater.cancel(progress.id)
+        embed = render()
+        embed.title = "Cleared Messages"
+        embed.colour = discord.Colour.green()
+        return await progress.edit(embed=embed)
     
     @commands.command(aliases=['count_role', 'role_count'])
     @commands.has_permissions(manage_guild=True)
@@ -74,47 +289,238 @@ class Utility(commands.Cog, name='utilities'):
         """
         now = datetime.now(timezone(timedelta(hours=TIMEZONE)))
         end = now + timedelta(minutes=duration)
+        await self.create_reminder(ctx, end, text, f"Reminding in {duration} minutes!")
+
+    @commands.command(aliases=['remindrepeat'])
+    async def remindevery(self, ctx, schedule: str, *, text):
+        """
+        Have the bot send a reminder repeatedly, until it is cancelled with
+        $unremind. The reminder can repeat after a duration, daily at a time,
+        or weekly on the given days at a time. Times are in 24 hour format.
+
+        Usage: $remindevery [duration, X(m/h/d) | daily | days] [time] [text]
+        Example: $remindevery 6h Drink water
+        Example: $remindevery daily 08:00 Take medicine
+        Example: $remindevery mon,wed,fri 19:30 Go to the gym
+        """
+        schedule = schedule.lower()
+        if schedule == 'daily' or all(day in DAY_NAMES for day in schedule.split(',')):
+            time, _, text = text.partition(' ')
+            match = re.fullmatch(r"([01]?\d|2[0-3]):([0-5]\d)", time)
+            if match is None or not text.strip():
+                raise commands.BadArgument("Provide a time in 24 hour format followed by the reminder text, eg 08:00 Take medicine")
+            time = f"{int(match[1]):02}:{match[2]}"
+            if schedule == 'daily':
+                rule = f"daily {time}"
+            else:
+                days = sorted({DAY_NAMES.index(day) for day in schedule.split(',')})
+                rule = f"weekly {','.join(map(str, days))} {time}"
+        else:
+            minutes = await Duration().convert(ctx, schedule)
+            if minutes < MIN_REPEAT_MINUTES:
+                raise commands.BadArgument(f"Repeating reminders must be at least {MIN_REPEAT_MINUTES} minutes apart.")
+            rule = f"interval {minutes}"
+
+        now = datetime.now(timezone(timedelta(hours=TIMEZONE)))
+        end = next_occurrence(rule, now, now)
+        await self.create_reminder(ctx, end, text.strip(), f"Reminding {describe_rule(rule)}!", rule)
 
+    async def create_reminder(self, ctx, end: datetime, text: str, description: str, rule: str=None):
+        """Post the reminder message, and store and schedule the reminder."""
         embed = discord.Embed(title=f"Reminder Created by {ctx.author}", 
                               description=text, 
                               colour=discord.Colour.blue(),
                               timestamp=end)
         embed.set_thumbnail(url=ctx.author.avatar_url)
         embed.add_field(name="The bot will remind all who reacted 🤚 below.", 
-                        value=f"Reminding in {duration} minutes!", inline=False)
+                        value=description, inline=False)
         embed.set_footer(text="Time to remind")
         message = await ctx.send(embed=embed)
-        await message.add_reaction('🤚')
         
-        row = (ctx.guild.id, ctx.channel.id, message.id, end, text)
+        row = (ctx.guild.id, ctx.channel.id, message.id, end, text, ctx.author.id, 1, rule)
+        with self.con:
+            self.con.execute(f"INSERT INTO reminders({REMINDER_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             row[:3] + (db_timestamp(end),) + row[4:])
+        self.track_reminder(message.id)
+        if end < self.horizon:
+            self.schedule_reminder(row)
+        await message.add_reaction('🤚')
+
+    @commands.command()
+    async def reminders(self, ctx):
+        """Shows the reminders in this server which you created or reacted 🤚 to."""
+        rows = self.con.execute("""SELECT channel_id, message_id, end, text, author_id, rule FROM reminders
+                                   WHERE guild_id = ? AND (author_id = ? OR message_id IN
+                                       (SELECT message_id FROM remindersubs WHERE user_id = ?))
+                                   ORDER BY end""", (ctx.guild.id, ctx.author.id, ctx.author.id)).fetchall()
+        if not rows:
+            return await ctx.send("You have no pending reminders in this server.")
+        result = f"**Reminders for {ctx.author}:**\n"
+        for channel_id, message_id, end, text, author_id, rule in rows:
+            owner = " (created by you)" if author_id == ctx.author.id else ""
+            repeats = f", repeating {describe_rule(rule)}" if rule else ""
+            result += f"`{message_id}` in <#{channel_id}> at {end.strftime('%d/%m/%Y %H:%M')}{repeats}{owner}: {text}\n"
+        return await smart_send(ctx, result + f"Use {ctx.prefix}unremind [id] to cancel one.")
+
+    @commands.command()
+    async def unremind(self, ctx, message_id: int):
+        """
+        Stop being reminded for a reminder. If you created the reminder, it is
+        cancelled for everyone.
+
+        Example: $unremind 716643449123456789
+        """
+        row = self.con.execute("SELECT channel_id, author_id FROM reminders WHERE message_id = ? AND guild_id = ?",
+                               (message_id, ctx.guild.id)).fetchone()
+        if row is None:
+            return await ctx.send("That reminder does not exist.")
+        channel_id, author_id = row
+
+        if author_id != ctx.author.id:
+            with self.con:
+                n = self.con.execute("DELETE FROM remindersubs WHERE message_id = ? AND user_id = ?",
+                                     (message_id, ctx.author.id)).rowcount
+            if n == 0:
+                return await ctx.send("You are not being reminded for that reminder.")
+            return await ctx.send("You will no longer be reminded for that reminder.")
+
+        with self.con:
+            self.con.execute("DELETE FROM reminders WHERE message_id = ?", (message_id,))
+        self.stop_reminder(message_id)
+        await self.close_reminder(channel_id, message_id, "Cancelled.")
+        return await ctx.send("Reminder cancelled.")
+
+    def load_reminders(self):
+        """Schedule the reminders which end before the next horizon, using the index on `end`."""
+        self.horizon = datetime.now(timezone(timedelta(hours=TIMEZONE))) + REMINDER_HORIZON
+        count = 0
+        for row in self.con.execute(f"SELECT {REMINDER_COLUMNS} FROM reminders WHERE end < ?", (db_timestamp(self.horizon),)):
+            if row[2] not in self.tasks:
+                self.schedule_reminder(row)
+                count += 1
+        if count:
+            logging.info(f"Scheduled {count} reminder tasks.")
+
+    @tasks.loop(minutes=SWEEP_MINUTES)
+    async def sweep_reminders(self):
+        # Remove reminders in deleted channels or guilds in bulk, then move the horizon forward.
+        # Channels of unavailable guilds are not known during an outage, so they are kept.
+        missing = list()
+        for guild_id, channel_id in self.con.execute("SELECT DISTINCT guild_id, channel_id FROM reminders").fetchall():
+            guild = self.bot.get_guild(guild_id)
+            if guild is None or (not guild.unavailable and guild.get_channel(channel_id) is None):
+                missing.append(channel_id)
+        if missing:
+            placeholders = ', '.join('?' * len(missing))
+            message_ids = [message_id for message_id, in self.con.execute(
+                f"SELECT message_id FROM reminders WHERE channel_id IN ({placeholders})", missing)]
+            with self.con:
+                self.con.execute(f"DELETE FROM reminders WHERE channel_id IN ({placeholders})", missing)
+            for message_id in message_ids:
+                self.stop_reminder(message_id)
+            logging.info(f"Pruned {len(message_ids)} reminders in deleted channels.")
+        self.load_reminders()
+
+    @sweep_reminders.before_loop
+    async def before_sweep_reminders(self):
+        # Channels are only known once the bot is ready
+        await self.bot.wait_until_ready()
+
+    def schedule_reminder(self, row):
+        """Schedule the reminder to end."""
+        # SQLite3 datetime comes out timezone naive, so need to change the timezone 
+        delta = (row[3].replace(tzinfo=timezone(timedelta(hours=TIMEZONE))) - datetime.now(timezone(timedelta(hours=TIMEZONE)))).total_seconds()
+        self.tasks[row[2]] = self.bot.schedule_task(delta, self.end_reminder(row))
+
+    def track_reminder(self, message_id: int):
+        """Record the subscribers of the reminder as they react."""
+        self.tracked.add(message_id)
+        self.bot.reaction_registry.register(message_id, self.on_reminder_reaction)
+
+    def stop_reminder(self, message_id: int):
+        task = self.tasks.pop(message_id, None)
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+        self.tracked.discard(message_id)
+        self.bot.reaction_registry.unregister(message_id)
+
+    def on_reminder_reaction(self, payload: discord.RawReactionActionEvent, added: bool):
+        # Called by the bot's reaction registry for reactions on reminder messages only
+        if payload.emoji.name != '🤚':
+            return
         with self.con:
-            self.con.execute("INSERT INTO reminders VALUES (?, ?, ?, ?, ?)", row)
-        self.tasks.add(self.bot.schedule_task(duration * 60, self.end_reminder(row)))
+            if added:
+                self.con.execute("INSERT OR IGNORE INTO remindersubs(message_id, user_id) VALUES (?, ?)",
+                                 (payload.message_id, payload.user_id))
+            else:
+                self.con.execute("DELETE FROM remindersubs WHERE message_id = ? AND user_id = ?",
+                                 (payload.message_id, payload.user_id))
+
+    async def close_reminder(self, channel_id: int, message_id: int, status: str, next_end: datetime=None):
+        """
+        Amend the reminder message embed to show it is done, or when it
+        will next remind if `next_end` is provided.
+        """
+        channel = self.bot.get_channel(channel_id)
+        if channel is None:
+            return
+        try:
+            message = await channel.fetch_message(message_id)
+            embeddict = message.embeds[0].to_dict()
+            embeddict['fields'][0]['value'] = status
+            if next_end is None:
+                embeddict['color'] = discord.Colour.red().value
+            else:
+                embeddict['timestamp'] = next_end.isoformat()
+            await message.edit(embed=discord.Embed.from_dict(embeddict))
+        except discord.HTTPException:
+            pass # Message no longer exists, just ignore
 
     async def end_reminder(self, db_row):
         """Function run upon reminder timer up."""
-        with self.con:
-            self.con.execute("DELETE FROM reminders WHERE message_id = ?", (db_row[2],))
-        self.tasks.discard(db_row[2])
-        
+        message_id = db_row[2]
+        if db_row[7] is None:
+            self.stop_reminder(message_id)
+        else:
+            self.tasks.pop(message_id, None) # Subscribers are still tracked for the next occurrence
         channel = self.bot.get_channel(db_row[1])
+
+        user_ids = list()
+        if db_row[6]:
+            user_ids = [user_id for user_id, in self.con.execute("SELECT user_id FROM remindersubs WHERE message_id = ?", (message_id,))]
+        elif channel is not None:
+            # Older reminders have to page through the reactions instead
+            try:
+                message = await channel.fetch_message(message_id)
+                user_ids = [x.id for x in await message.reactions[0].users().flatten() if x != self.bot.user]
+            except (discord.HTTPException, IndexError):
+                pass
+        next_end = None
+        with self.con:
+            if db_row[7] is None:
+                self.con.execute("DELETE FROM reminders WHERE message_id = ?", (message_id,))
+            else:
+                # Only the next occurrence is worked out, when the previous one ends
+                now = datetime.now(timezone(timedelta(hours=TIMEZONE)))
+                next_end = next_occurrence(db_row[7], db_row[3].replace(tzinfo=now.tzinfo), now)
+                self.con.execute("UPDATE reminders SET end = ? WHERE message_id = ?", (db_timestamp(next_end), message_id))
+        if next_end is not None and next_end < self.horizon:
+            self.schedule_reminder(db_row[:3] + (next_end,) + db_row[4:])
         if channel is None:
             return # Channel no longer exists, just ignore
-        message = await channel.fetch_message(db_row[2])
-        if message is None:
-            return # Message no longer exists, just ignore
 
-        users = (x.mention for x in await message.reactions[0].users().flatten() if x != self.bot.user)
-        if users:
-            text = f"Reminder for `{db_row[4]}`: " + ', '.join(users) + '.'
-            await smart_send(channel, text)
+        # Send the mentions in chunks, spaced out to avoid being rate limited
+        for i in range(0, len(user_ids), MENTION_CHUNK):
+            if i:
+                await asyncio.sleep(MENTION_INTERVAL)
+            mentions = ', '.join(f"<@{user_id}>" for user_id in user_ids[i:i + MENTION_CHUNK])
+            await smart_send(channel, f"Reminder for `{db_row[4]}`: {mentions}.")
 
-        # Amend reminder message embed to show it is done
-        embeddict = message.embeds[0].to_dict()
-        embeddict['fields'][0]['value'] = "Reminded!"
-        embeddict['color'] = discord.Colour.red().value
-        await message.edit(embed=discord.Embed.from_dict(embeddict))
+        if next_end is None:
+            await self.close_reminder(db_row[1], message_id, "Reminded!")
+        else:
+            await self.close_reminder(db_row[1], message_id, f"Reminding {describe_rule(db_row[7])}!", next_end)
 
 
 def setup(bot):
-    bot.add_cog(Utility(bot))
\ No newline at end of file
+    bot.add_cog(Utility(bot))
@@ -0,0 +1,75 @@
+import asyncio
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+from os.path import dirname, abspath
+from types import SimpleNamespace
+
+import discord
+
+sys.path.insert(0, dirname(dirname(abspath(__file__)))) # Cogs are imported relative to where bot.py is
+from cogs.moderation import Moderation
+
+GUILD_ID = 1000
+BOT_ID = 1
+MODERATOR_ID = 2
+
+class StubGuild:
+    """A guild whose audit log is served by a stubbed HTTP client, through the library's own iterator."""
+    audit_logs = discord.Guild.audit_logs
+
+    def __init__(self, loop, entries):
+        self.id = GUILD_ID
+        self.entries = entries # Newest first, as returned by Discord
+        self._state = SimpleNamespace(loop=loop, http=SimpleNamespace(get_audit_logs=self.get_audit_logs))
+
+    async def get_audit_logs(self, guild_id, limit=100, before=None, after=None, user_id=None, action_type=None):
+        entries = [e for e in self.entries if before is None or int(e['id']) < before][:limit]
+        # Discord returns every user the entries refer to, moderators and targets alike
+        ids = {e[key] for e in entries for key in ('user_id', 'target_id')}
+        users = [{'id': i, 'username': f"user{i}", 'discriminator': '0001', 'avatar': None} for i in ids]
+        return {'audit_log_entries': entries, 'users': users}
+
+    def get_member(self, user_id):
+        return None
+
+START = datetime.utcnow()
+
+def entry(user_id: int, action: discord.AuditLogAction, target_id: int, seconds: int) -> dict:
+    """An audit log entry made `seconds` after the test started."""
+    snowflake = discord.utils.time_snowflake(START + timedelta(seconds=seconds))
+    return {'id': str(snowflake), 'user_id': str(user_id), 'target_id': str(target_id),
+            'action_type': action.value, 'reason': None}
+
+def test_poll_only_ingests_new_entries():
+    async def run():
+        loop = asyncio.get_running_loop()
+        never = loop.create_future()
+        bot = SimpleNamespace(con=sqlite3.connect(':memory:', detect_types=sqlite3.PARSE_DECLTYPES),
+                              user=SimpleNamespace(id=BOT_ID), guilds=[], wait_until_ready=lambda: asyncio.shield(never))
+        cog = Moderation(bot)
+        try:
+            guild = StubGuild(loop, [entry(MODERATOR_ID, discord.AuditLogAction.ban, 10, -60)])
+            count = lambda: bot.con.execute("SELECT COUNT(*) FROM modlog WHERE guild_id = ?", (GUILD_ID,)).fetchone()[0]
+
+            # The first poll only sets the cursor, without backfilling older history
+            await cog.ingest_audit_log(guild)
+            assert count() == 0
+
+            # New entries, newest first, including one made by the bot itself
+            guild.entries[:0] = [entry(MODERATOR_ID, discord.AuditLogAction.unban, 10, 3),
+                                 entry(BOT_ID, discord.AuditLogAction.kick, 11, 2),
+                                 entry(MODERATOR_ID, discord.AuditLogAction.kick, 12, 1)]
+            await cog.ingest_audit_log(guild)
+            rows = bot.con.execute("SELECT case_id, user_id, type FROM modlog WHERE guild_id = ? ORDER BY case_id",
+                                   (GUILD_ID,)).fetchall()
+            assert rows == [(1, 12, 'kick'), (2, 10, 'unban')]
+
+            # Nothing new, so a second poll inserts nothing
+            await cog.ingest_audit_log(guild)
+            assert count() == 2
+        finally:
+            cog.cog_unload()
+            never.cancel()
+
+    asyncio.run(run())
@@ -0,0 +1,61 @@
+import asyncio
+import sys
+from os.path import dirname, abspath
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+sys.path.insert(0, dirname(dirname(abspath(__file__)))) # Cogs are imported relative to where bot.py is
+from cogs.helper import HttpClient
+
+BODY = b'{"calendarEventList": []}'
+ETAG = '"v1"'
+LAST_MODIFIED = 'Mon, 19 Oct 2026 00:00:00 GMT'
+
+def test_conditional_get(tmp_path):
+    requests = []
+
+    async def handler(request):
+        requests.append(request.headers.copy())
+        if request.headers.get('If-None-Match') == ETAG:
+            return web.Response(status=304)
+        return web.Response(body=BODY, headers={'ETag': ETAG, 'Last-Modified': LAST_MODIFIED})
+
+    async def run():
+        app = web.Application()
+        app.router.add_get('/calendar', handler)
+        server = TestServer(app)
+        await server.start_server()
+        url = str(server.make_url('/calendar'))
+        loop = asyncio.get_running_loop()
+        try:
+            # First request has nothing cached, so it is a plain GET
+            client = HttpClient(loop, str(tmp_path))
+            try:
+                first = await client.get(url)
+                second = await client.get(url)
+            finally:
+                await client.close()
+
+            # A new client, as after a restart, reads the validators and body from disk
+            client = HttpClient(loop, str(tmp_path))
+            try:
+                third = await client.get(url)
+            finally:
+                await client.close()
+        finally:
+            await server.close()
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+
+    assert first.body == BODY and first.modified
+    assert 'If-None-Match' not in requests[0]
+
+    assert second.body == BODY and not second.modified
+    assert requests[1]['If-None-Match'] == ETAG
+    assert requests[1]['If-Modified-Since'] == LAST_MODIFIED
+
+    assert third.body == BODY and not third.modified
+    assert requests[2]['If-None-Match'] == ETAG
+    assert len(requests) == 3